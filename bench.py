@@ -0,0 +1,187 @@
+#!/usr/env/python
+# Sudoku.solve 벤치마크
+# main() 에 주석으로 있던 퍼즐들을 난이도 별 tier 로 묶고, 숫자/행/열을 섞은 변형으로 개수를 늘려서
+# tier 별 처리량, p50/p99 latency, peak memory, technique 별 시간을 잰다
+#
+#   python bench.py --output new.json --compare old.json
+from collections import defaultdict
+import argparse
+import json
+import random
+import sys
+import time
+import tracemalloc
+
+import sudoku
+
+tiers = {
+    "easy": [
+        "000904600040000831820610000090832107218745000703006000002000400185429060370000020", # Easy
+        "000000000904607000076804100309701080708000301051308702007502610005403208000070000", # Namu - Hidden 2
+        "027605930000000002003280500758136294030804000140502803001020600380061020060758319", # Namu - Hidden 4
+    ],
+    "expert": [
+        "080001069000000000016400000004206000000130000000000802038000000040007050000029047", # Expert
+        "036820005580034000190000000020900000900306002000002050000000046000680093600090520", # Namu - Naked 4
+    ],
+    "master": [
+        "090005000400000800008203060000090000070000001004608030002050000000040090100902003", # Master
+        "000000010000002003000400000000000500401600000007100000050000200000080040030910000", # Wiki-17
+    ],
+    "extreme": [
+        "100007090030020008009600500005300900010080002600004000300000010040000007007000300", # AI Escargot
+        "000000039000001005003050800008090006070002000100400000009080050020000600400700000", # Golden Nugget
+        "000000012000000003002300400001800005060070800000009000008500000900040500470006000", # Platinum Blonde
+        "800000000003600000070090200050007000000045700000100030001000068008500010090000400", # Arto Inkala
+    ],
+}
+
+# tier 의 퍼즐마다 variants 개의 무작위 변형을 더한다 (난이도는 그대로)
+def build_corpus(names, variants, seed):
+    rng = random.Random(seed)
+    corpus = dict()
+    for name in names:
+        puzzles = []
+        for text in tiers[name]:
+            grid = sudoku.parse_puzzle(text)
+            puzzles.append(grid)
+            for _ in range(variants):
+                puzzles.append(sudoku.random_transform(grid, rng))
+        corpus[name] = puzzles
+    return corpus
+
+# 퍼즐 하나를 풀고 (걸린 시간, 상태) 를 돌려준다. technique 별 통계는 stats 에 더한다
+# patterns 가 False 면 Try 전의 pattern 단계 (Sudoku.solve_patterns) 를 끈다
+def solve_one(grid, engine, stats=None, patterns=True):
+    board = sudoku.Sudoku(engine=engine, gui=False)
+    board.set_print(False)
+    board.set_patterns(patterns)
+    if stats is not None:
+        board.enable_stats(stats)
+    start = time.perf_counter()
+    try:
+        board.set_grid(grid)
+        board.solve(recursion=True)
+        status = "solved" if 0 not in board.get_grid() else "partial"
+    except Exception:
+        status = "no_solution"
+    return (time.perf_counter() - start, status)
+
+def percentile(values, fraction):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(fraction * (len(values) - 1))))
+    return values[index]
+
+def peak_memory(puzzles, engine, limit):
+    peak = 0
+    for grid in puzzles[:limit]:
+        tracemalloc.start()
+        solve_one(grid, engine)
+        peak = max(peak, tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+    return peak
+
+# 퍼즐을 채운 판 하나가 붙잡고 있는 메모리 (count 개를 만들어 평균)
+def board_memory(grid, engine, count=100):
+    tracemalloc.start()
+    boards = []
+    for _ in range(count):
+        board = sudoku.Sudoku(engine=engine, gui=False)
+        board.set_print(False)
+        board.set_grid(grid)
+        boards.append(board)
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return size / count
+
+def run_tier(puzzles, engine, repeat, memory_samples, patterns=True):
+    latencies = []
+    statuses = defaultdict(int)
+    stats = sudoku.SolveStats()
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for grid in puzzles:
+            (elapsed, status) = solve_one(grid, engine, stats, patterns)
+            latencies.append(elapsed)
+            statuses[status] += 1
+    wall = time.perf_counter() - start
+    return {
+        "puzzles": len(latencies),
+        "seconds": wall,
+        "puzzles_per_sec": len(latencies) / wall if wall > 0 else 0.0,
+        "p50_ms": percentile(latencies, 0.5) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "peak_kb": peak_memory(puzzles, engine, memory_samples) / 1024,
+        "status": dict(statuses),
+        # try / subsection 은 그 안에서 부른 technique 시간을 포함한다
+        "technique_seconds": dict(stats.seconds),
+        "try_rounds": stats.counts[("try", "calls")],
+        "probes": stats.counts[("probe", "calls")],
+        "probe_rounds_saved": sum(count for ((technique, name), count) in stats.counts.items() if name == "probe_rounds_saved"),
+        "stats": stats.as_dict(),
+    }
+
+def print_report(results, out=sys.stdout):
+    out.write("board    %.1f KB\n" % results["board_kb"])
+    out.write("%-8s %7s %10s %10s %10s %10s %7s %7s %7s\n" % ("tier", "count", "puzzles/s", "p50 ms", "p99 ms", "peak KB", "tries", "probes", "saved"))
+    for name, tier in results["tiers"].items():
+        out.write("%-8s %7d %10.1f %10.2f %10.2f %10.1f %7d %7d %7d\n" % (name, tier["puzzles"], tier["puzzles_per_sec"], tier["p50_ms"], tier["p99_ms"], tier["peak_kb"], tier["try_rounds"], tier["probes"], tier["probe_rounds_saved"]))
+        out.write("         " + "  ".join("%s=%.3fs" % (technique, seconds) for technique, seconds in sorted(tier["technique_seconds"].items())) + "\n")
+
+# 이전 결과와 비교해서 threshold 배 이상 느려진 tier 를 돌려준다
+def compare(old, new, threshold, out=sys.stdout):
+    regressions = []
+    for name, tier in new["tiers"].items():
+        if name not in old["tiers"]:
+            continue
+        before = old["tiers"][name]
+        ratio = before["puzzles_per_sec"] / tier["puzzles_per_sec"] if tier["puzzles_per_sec"] > 0 else float("inf")
+        p99_ratio = tier["p99_ms"] / before["p99_ms"] if before["p99_ms"] > 0 else float("inf")
+        flag = ""
+        if ratio > threshold or p99_ratio > threshold:
+            flag = "  REGRESSION"
+            regressions.append(name)
+        out.write("%-8s throughput x%.2f  p99 x%.2f%s\n" % (name, 1 / ratio if ratio > 0 else float("inf"), p99_ratio, flag))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark Sudoku.solve on a tiered puzzle corpus")
+    parser.add_argument("--tiers", default=",".join(tiers.keys()), help="comma separated tiers to run")
+    parser.add_argument("--variants", type=int, default=4, help="random relabel/permute variants added per puzzle")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engine", choices=sorted(sudoku.engines.keys()), default="mask")
+    parser.add_argument("--no-patterns", action="store_true", help="skip locked candidates / fish / XY-Wing before Try")
+    parser.add_argument("--memory-samples", type=int, default=3, help="puzzles per tier traced for peak memory")
+    parser.add_argument("--output", metavar="FILE", help="write results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare against a previous --output")
+    parser.add_argument("--threshold", type=float, default=1.10, help="slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    names = [name for name in args.tiers.split(",") if name]
+    corpus = build_corpus(names, args.variants, args.seed)
+    results = {
+        "engine": args.engine,
+        "variants": args.variants,
+        "repeat": args.repeat,
+        "seed": args.seed,
+        "patterns": not args.no_patterns,
+        "python": sys.version.split()[0],
+        "tiers": dict(),
+        "board_kb": board_memory(corpus[names[0]][0], args.engine) / 1024 if names else 0.0,
+    }
+    for name in names:
+        results["tiers"][name] = run_tier(corpus[name], args.engine, args.repeat, args.memory_samples, not args.no_patterns)
+    print_report(results)
+
+    if args.output is not None:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.compare is not None:
+        with open(args.compare) as f:
+            old = json.load(f)
+        if compare(old, results, args.threshold):
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
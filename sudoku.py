@@ -1,41 +1,267 @@
 #!/usr/env/python
-from collections import defaultdict
+from collections import OrderedDict, defaultdict
+from math import comb, isqrt
+import argparse
+import base64
+import concurrent.futures
+import functools
+import io
 import itertools
+import json
+import mmap
+import multiprocessing
+import os
+import struct
+import sys
+import threading
+import time
 
 cell_size = 60
 cell_margin = 6
 font_size = 6
+
+# 후보 숫자 v 는 bit (v-1) 로 표현한다
+all_values_mask = (1 << 9) - 1
+
+if hasattr(int, "bit_count"):
+    def popcount(mask):
+        return mask.bit_count()
+else:
+    def popcount(mask):
+        return bin(mask).count("1")
+
+def lowest_bit(mask):
+    return mask & -mask
+
+def bit_to_value(bit):
+    return bit.bit_length()
+
+def value_to_bit(value):
+    return 1 << (value - 1)
+
+def mask_to_values(mask):
+    values = []
+    while mask:
+        bit = mask & -mask
+        values.append(bit.bit_length())
+        mask ^= bit
+    return values
+
+# mask -> 오름차순 후보 숫자 tuple
+mask_values = [tuple(mask_to_values(mask)) for mask in range(all_values_mask + 1)]
+
+# 숫자가 많아 표를 다 만들 수 없을 때 (16, 25) 쓰는 mask_values. 처음 본 mask 만 계산해서 채운다
+class MaskValues(dict):
+    def __missing__(self, mask):
+        values = tuple(mask_to_values(mask))
+        self[mask] = values
+        return values
+
+def values_to_mask(values):
+    mask = 0
+    for value in values:
+        mask |= 1 << (value - 1)
+    return mask
+
+# items 중 size 개를 itertools.combinations 순서대로 고르되
+# masks 의 합집합이 size 개를 넘는 조합은 고르는 도중에 잘라내고
+# changed 에 든 item 이 하나도 없는 조합은 건너뛴다
+# masks 는 매 단계에서 다시 읽으므로 도중에 줄어든 mask 도 반영된다
+def subset_combinations(items, masks, size, changed):
+    count = len(items)
+    changed_after = [False] * (count + 1)
+    for index in range(count - 1, -1, -1):
+        changed_after[index] = changed_after[index + 1] or items[index] in changed
+
+    def walk(start, chosen, union, has_changed):
+        for index in range(start, count - (size - len(chosen)) + 1):
+            if not has_changed and not changed_after[index]:
+                break
+            item = items[index]
+            new_union = union | masks[item]
+            if popcount(new_union) > size:
+                continue
+            now_changed = has_changed or item in changed
+            if len(chosen) + 1 == size:
+                if now_changed:
+                    yield tuple(chosen) + (item,)
+            else:
+                chosen.append(item)
+                yield from walk(index + 1, chosen, new_union, now_changed)
+                chosen.pop()
+
+    return walk(0, [], 0, False)
+
+# 상자 한 변이 box 칸인 판 (3 이면 9x9, 4 면 16x16, 5 면 25x25) 의 미리 계산해 둔 unit / peer 테이블
+# unit key 규칙은 Cell.get_row_key / get_col_key / get_rect_key 와 같다
+class Geometry:
+    def __init__(self, box):
+        size = box * box
+        self.box = box
+        self.size = size
+        self.cell_count = size * size
+        self.all_values_mask = (1 << size) - 1
+        self.values = tuple(range(1, size + 1))
+        self.all_values = frozenset(self.values)
+        self.mask_values = mask_values if size == 9 else MaskValues()
+        lines = range(1, size + 1)
+        self.cell_keys = [(row, col) for row in lines for col in lines]
+        self.row_keys = [(-row, 0) for row in lines]
+        self.col_keys = [(0, -col) for col in lines]
+        self.rect_keys = [(-rect_row, -rect_col) for rect_row in range(1, box + 1) for rect_col in range(1, box + 1)]
+        self.unit_keys = self.row_keys + self.col_keys + self.rect_keys
+
+        self.unit_cells = dict()
+        for row in lines:
+            self.unit_cells[(-row, 0)] = tuple((row, col) for col in lines)
+        for col in lines:
+            self.unit_cells[(0, -col)] = tuple((row, col) for row in lines)
+        for rect_row in range(box):
+            for rect_col in range(box):
+                self.unit_cells[(-rect_row-1, -rect_col-1)] = tuple((rect_row*box + row, rect_col*box + col) for row in range(1, box + 1) for col in range(1, box + 1))
+
+        self.cell_units = dict()
+        self.cell_peers = dict()
+        for key in self.cell_keys:
+            (row, col) = key
+            self.cell_units[key] = ((-row, 0), (0, -col), self.rect_key(key))
+            # set_value 가 unit 을 도는 순서(row, col, rect) 그대로 중복만 제거
+            peers = []
+            for unit_key in self.cell_units[key]:
+                for peer_key in self.unit_cells[unit_key]:
+                    if peer_key != key and peer_key not in peers:
+                        peers.append(peer_key)
+            self.cell_peers[key] = tuple(peers)
+        self.peer_sets = {key: frozenset(peers) for key, peers in self.cell_peers.items()}
+
+        # rect 와 row / col 이 겹치는 곳: (rect key, line key, 겹친 cell, rect 의 나머지, line 의 나머지)
+        # locked candidates (pointing / claiming) 용
+        self.intersections = []
+        for rect_key in self.rect_keys:
+            rect = self.unit_cells[rect_key]
+            for line_key in self.row_keys + self.col_keys:
+                line = self.unit_cells[line_key]
+                cells = tuple(key for key in line if key in rect)
+                if cells:
+                    self.intersections.append((
+                        rect_key,
+                        line_key,
+                        cells,
+                        tuple(key for key in rect if key not in cells),
+                        tuple(key for key in line if key not in cells),
+                    ))
+
+        # 같은 테이블의 0 부터 시작하는 index 버전 (mask engine 용)
+        self.unit_indices = [tuple(self.cell_index(key) for key in self.unit_cells[unit_key]) for unit_key in self.unit_keys]
+        self.peer_indices = [tuple(self.cell_index(peer_key) for peer_key in self.cell_peers[key]) for key in self.cell_keys]
+        # index -> 0 부터 시작하는 row / col / rect 번호
+        self.index_row = [index // size for index in range(self.cell_count)]
+        self.index_col = [index % size for index in range(self.cell_count)]
+        self.index_rect = [(index // (size * box)) * box + (index % size) // box for index in range(self.cell_count)]
+        self.exact_cover_rows = None
+        self.exact_cover_columns = None
+
+    def cell_index(self, key):
+        (row, col) = key
+        return (row - 1) * self.size + (col - 1)
+
+    def rect_key(self, key):
+        (row, col) = key
+        return (-((row-1)//self.box)-1, -((col-1)//self.box)-1)
+
+    # search_solutions 의 exact cover 행렬. 처음 쓸 때 만든다
+    # row (index, value) 는 cell / row 숫자 / col 숫자 / rect 숫자 네 column 을 덮는다
+    def exact_cover(self):
+        if self.exact_cover_rows is None:
+            size = self.size
+            count = self.cell_count
+            rows = dict()
+            for index in range(count):
+                for value in self.values:
+                    rows[(index, value)] = (
+                        index,
+                        count + self.index_row[index] * size + value - 1,
+                        2 * count + self.index_col[index] * size + value - 1,
+                        3 * count + self.index_rect[index] * size + value - 1,
+                    )
+            columns = defaultdict(set)
+            for row_key, row_columns in rows.items():
+                for column in row_columns:
+                    columns[column].add(row_key)
+            (self.exact_cover_rows, self.exact_cover_columns) = (rows, columns)
+        return (self.exact_cover_rows, self.exact_cover_columns)
+
+geometries = dict()
+
+# 한 변이 size 칸인 판의 Geometry (size 는 4, 9, 16, 25 같은 제곱수)
+def geometry_for(size):
+    if size not in geometries:
+        box = isqrt(size)
+        if box * box != size or box < 2:
+            raise Exception("Board size must be a square number, got %s" % str(size))
+        geometries[size] = Geometry(box)
+    return geometries[size]
+
+# 칸 수로 정한 Geometry (size * size 개의 숫자 list 용)
+def grid_geometry(grid):
+    return geometry_for(isqrt(len(grid)))
+
+# 9x9 판. 아래 이름들은 이 판의 테이블을 그대로 가리킨다
+standard = geometry_for(9)
+cell_keys = standard.cell_keys
+row_keys = standard.row_keys
+col_keys = standard.col_keys
+rect_keys = standard.rect_keys
+unit_keys = standard.unit_keys
+unit_cells = standard.unit_cells
+cell_units = standard.cell_units
+cell_peers = standard.cell_peers
+unit_indices = standard.unit_indices
+peer_indices = standard.peer_indices
+index_row = standard.index_row
+index_col = standard.index_col
+index_rect = standard.index_rect
+cell_index = standard.cell_index
+
+all_values = standard.all_values
+no_values = frozenset()
+
 class Cell:
+    # 판 하나에 81 개씩, probe / copy 마다 더 만들어지므로 __dict__ 없이 둔다
+    # impossible 은 possible 의 여집합이라 따로 들고 있지 않는다. *_text 는 canvas 가 있을 때만 채워진다
+    __slots__ = ("board", "key", "value", "possible", "recently_removed", "possible_text", "impossible_text", "known_text")
+
     def __init__(self, board, key, value=0):
-        self.recently_removed = set()
+        # 화면에 보여줄 때만 채워지므로 비어 있는 동안은 모든 cell 이 같은 frozenset 을 쓴다
+        self.recently_removed = no_values
         if value == 0:
-            self.possible = set(range(1, 10))
-            self.impossible = set()
+            self.possible = set(board.geometry.values)
         else:
             self.possible = set([value])
-            self.impossible = set(range(1, 10))
-            self.impossible.remove(value)
         self.board = board
         self.value = value
         self.key = key
 
         if self.board.canvas is not None:
-            row, col = key
-            pos_x = col*cell_size - cell_size + cell_margin
-            pos_y = row*cell_size - cell_size + cell_margin
-            self.board.canvas.create_rectangle(pos_x, pos_y, pos_x + cell_size, pos_y + cell_size)
-            obj = self.board.canvas.create_rectangle(pos_x, pos_y, pos_x + cell_size, pos_y + cell_size, fill="lightblue")
-            self.board.canvas_units[key] = obj
-            self.possible_text = self.board.canvas.create_text(pos_x+cell_margin, pos_y+1*cell_margin, fill="blue", text="possibles", anchor="nw", font=('Times', font_size), width=cell_size-2*cell_margin)
-            self.board.canvas.itemconfigure(self.possible_text, state="normal")
-            self.impossible_text = self.board.canvas.create_text(pos_x+cell_margin, pos_y+3*cell_margin, fill="red", text="impossibles\nrecent", anchor="nw", font=('Times', font_size), width=cell_size-2*cell_margin)
-            self.board.canvas.itemconfigure(self.impossible_text, state="normal")
-            self.known_text = self.board.canvas.create_text(pos_x+cell_size/2, pos_y+cell_size/2, fill="black", text="known", anchor="center", font=('Times', font_size*2), width=cell_size-2*cell_margin)
-            self.board.canvas.itemconfigure(self.known_text, state="hidden")
-            obj = self.board.canvas.create_text(pos_x+cell_margin, pos_y+6.5*cell_margin, fill="purple", text="interest", anchor="nw", font=('Times', font_size), width=cell_size-2*cell_margin)
-            self.board.canvas_interests[key] = obj
+            self.create_canvas_items()
     pass
 
+    def create_canvas_items(self):
+        row, col = self.key
+        pos_x = col*cell_size - cell_size + cell_margin
+        pos_y = row*cell_size - cell_size + cell_margin
+        self.board.canvas.create_rectangle(pos_x, pos_y, pos_x + cell_size, pos_y + cell_size)
+        obj = self.board.canvas.create_rectangle(pos_x, pos_y, pos_x + cell_size, pos_y + cell_size, fill="lightblue")
+        self.board.canvas_units[self.key] = obj
+        self.possible_text = self.board.canvas.create_text(pos_x+cell_margin, pos_y+1*cell_margin, fill="blue", text="possibles", anchor="nw", font=('Times', font_size), width=cell_size-2*cell_margin)
+        self.board.canvas.itemconfigure(self.possible_text, state="normal")
+        self.impossible_text = self.board.canvas.create_text(pos_x+cell_margin, pos_y+3*cell_margin, fill="red", text="impossibles\nrecent", anchor="nw", font=('Times', font_size), width=cell_size-2*cell_margin)
+        self.board.canvas.itemconfigure(self.impossible_text, state="normal")
+        self.known_text = self.board.canvas.create_text(pos_x+cell_size/2, pos_y+cell_size/2, fill="black", text="known", anchor="center", font=('Times', font_size*2), width=cell_size-2*cell_margin)
+        self.board.canvas.itemconfigure(self.known_text, state="hidden")
+        obj = self.board.canvas.create_text(pos_x+cell_margin, pos_y+6.5*cell_margin, fill="purple", text="interest", anchor="nw", font=('Times', font_size), width=cell_size-2*cell_margin)
+        self.board.canvas_interests[self.key] = obj
+
     def update_text(self):
         if self.board.canvas is not None:
             if self.value != 0:
@@ -57,31 +283,64 @@ class Cell:
     def copy(self, new_board):
         new_cell = Cell(new_board, self.key, self.value)
         new_cell.possible = set(self.possible.copy())
-        new_cell.impossible = set(self.impossible.copy())
         return new_cell
 
+    def clear_recent(self):
+        self.recently_removed = no_values
+
+    @property
+    def impossible(self):
+        return self.board.geometry.all_values.difference(self.possible)
+
+    @property
+    def mask(self):
+        return values_to_mask(self.possible)
+
+    def count(self):
+        return len(self.possible)
+
+    def remove_mask(self, mask):
+        return self.remove_possible(set(self.board.geometry.mask_values[mask]))
+
+    # trail 에 기록된 이전 상태로 되돌린다 (Sudoku.rollback 에서만 부른다)
+    def restore(self, mask, value):
+        self.possible = set(self.board.geometry.mask_values[mask])
+        self.recently_removed = self.recently_removed.difference(self.possible)
+        self.value = value
+
     def remove_possible(self, value=int or set(int)):
         ret = False
         if isinstance(value, set):
             to_remove = value.intersection(self.possible)
             if len(to_remove) > 0:
+                if self.board.trail is not None:
+                    self.board.trail.append((self, self.mask, self.value))
+                if self.board.stats is not None:
+                    self.board.stats.counts[(self.board.technique, "eliminated")] += len(to_remove)
+                if self.board.budget is not None and self.board.trail is None:
+                    self.board.budget.eliminated += len(to_remove)
                 self.possible = self.possible.difference(to_remove)
-                self.impossible = self.impossible.union(to_remove)    
-                self.recently_removed = self.recently_removed.union(to_remove)
+                if self.board.observed:
+                    self.recently_removed = self.recently_removed.union(to_remove)
                 ret = True
         elif isinstance(value, int):
             if value in self.possible:
+                if self.board.trail is not None:
+                    self.board.trail.append((self, self.mask, self.value))
+                if self.board.stats is not None:
+                    self.board.stats.counts[(self.board.technique, "eliminated")] += 1
+                if self.board.budget is not None and self.board.trail is None:
+                    self.board.budget.eliminated += 1
                 self.possible.remove(value)
-                self.impossible.add(value)
-                self.recently_removed.add(value)
+                if self.board.observed:
+                    self.recently_removed = self.recently_removed.union((value,))
                 ret = True
         else:
             raise Exception("Invalid type for value")
         if ret:
             self.board.mark_changed(self.key)
-            self.update_text()
-        assert len(self.possible) + len(self.impossible) == 9
-        assert len(self.possible.intersection(self.impossible)) == 0
+            if self.board.observed:
+                self.update_text()
         if len(self.possible) == 0:
             raise Exception("No possible value at cell %s" % str(self.key))
         return ret
@@ -91,20 +350,21 @@ class Cell:
             ret = False
         else:
             ret = True
+        if self.board.trail is not None:
+            self.board.trail.append((self, self.mask, self.value))
         self.possible = set([value])
-        self.impossible = set(range(1, 10))
-        self.impossible.remove(value)
         self.value = value
         if ret:
+            if self.board.stats is not None:
+                self.board.stats.counts[(self.board.technique, "placed")] += 1
             self.board.known_cells[self.key] = self.board.unknown_cells.pop(self.key)
-            self.board.mark_changed(self.key)
-            for unit_key in self.get_unit_keys():
-                for cell_key in self.board.get_unsolved_unit_cell_keys(unit_key):
-                    if cell_key == self.key:
-                        continue
-                    cell = self.board.get_cell(cell_key)
-                    cell.remove_possible(value)
-            self.update_text()
+            self.board.mark_solved(self.key)
+            unknown_cells = self.board.unknown_cells
+            for cell_key in self.board.geometry.cell_peers[self.key]:
+                if cell_key in unknown_cells:
+                    unknown_cells[cell_key].remove_possible(value)
+            if self.board.observed:
+                self.update_text()
         return ret
     
     def get_row_key(self):
@@ -116,64 +376,372 @@ class Cell:
         return (0, -col)
     
     def get_rect_key(self):
-        (row, col) = self.key
-        return (-((row-1)//3)-1, -((col-1)//3)-1)
+        return self.board.geometry.rect_key(self.key)
     
     def get_unit_keys(self):
-        return [self.get_row_key(), self.get_col_key(), self.get_rect_key()]
+        return self.board.geometry.cell_units[self.key]
+
+# possible 을 set 대신 board.masks 의 정수 (판 크기 만큼의 bit) 로 들고 있는 Cell
+# possible / impossible / recently_removed 는 읽을 때만 set 으로 만들어진다
+class MaskCell(Cell):
+    __slots__ = ("index",)
+
+    def __init__(self, board, key, value=0):
+        self.board = board
+        self.key = key
+        self.index = board.geometry.cell_index(key)
+        if value == 0:
+            board.masks[self.index] = board.geometry.all_values_mask
+        else:
+            board.masks[self.index] = value_to_bit(value)
+        board.values[self.index] = value
+        board.recent[self.index] = 0
+
+        if self.board.canvas is not None:
+            self.create_canvas_items()
+
+    @property
+    def value(self):
+        return self.board.values[self.index]
+
+    @property
+    def mask(self):
+        return self.board.masks[self.index]
+
+    @property
+    def possible(self):
+        return set(self.board.geometry.mask_values[self.board.masks[self.index]])
+
+    @property
+    def impossible(self):
+        geometry = self.board.geometry
+        return set(geometry.mask_values[geometry.all_values_mask & ~self.board.masks[self.index]])
+
+    @property
+    def recently_removed(self):
+        return set(self.board.geometry.mask_values[self.board.recent[self.index]])
+
+    def count(self):
+        return popcount(self.board.masks[self.index])
+
+    def copy(self, new_board):
+        new_cell = MaskCell(new_board, self.key, self.value)
+        new_board.masks[self.index] = self.board.masks[self.index]
+        return new_cell
+
+    def clear_recent(self):
+        self.board.recent[self.index] = 0
+
+    def restore(self, mask, value):
+        self.board.masks[self.index] = mask
+        self.board.values[self.index] = value
+        self.board.recent[self.index] &= ~mask
+
+    def remove_possible(self, value=int or set(int)):
+        if isinstance(value, set):
+            return self.remove_mask(values_to_mask(value))
+        elif isinstance(value, int):
+            return self.remove_mask(value_to_bit(value))
+        else:
+            raise Exception("Invalid type for value")
+
+    def remove_mask(self, mask):
+        ret = False
+        board = self.board
+        index = self.index
+        to_remove = board.masks[index] & mask
+        if to_remove:
+            if board.trail is not None:
+                board.trail.append((self, board.masks[index], board.values[index]))
+            if board.stats is not None:
+                board.stats.counts[(board.technique, "eliminated")] += popcount(to_remove)
+            if board.budget is not None and board.trail is None:
+                board.budget.eliminated += popcount(to_remove)
+            board.masks[index] ^= to_remove
+            board.mark_changed(self.key)
+            if board.observed:
+                board.recent[index] |= to_remove
+                self.update_text()
+            ret = True
+        if board.masks[index] == 0:
+            raise Exception("No possible value at cell %s" % str(self.key))
+        return ret
+
+    def set_value(self, value=int):
+        board = self.board
+        index = self.index
+        if board.values[index] == value:
+            ret = False
+        else:
+            ret = True
+        if board.trail is not None:
+            board.trail.append((self, board.masks[index], board.values[index]))
+        board.masks[index] = value_to_bit(value)
+        board.values[index] = value
+        if ret:
+            if board.stats is not None:
+                board.stats.counts[(board.technique, "placed")] += 1
+            board.known_cells[self.key] = board.unknown_cells.pop(self.key)
+            board.mark_solved(self.key)
+            bit = value_to_bit(value)
+            unknown_cells = board.unknown_cells
+            for cell_key in board.geometry.cell_peers[self.key]:
+                if cell_key in unknown_cells:
+                    unknown_cells[cell_key].remove_mask(bit)
+            if board.observed:
+                self.update_text()
+        return ret
 
+engines = {
+    "set": Cell,
+    "mask": MaskCell,
+}
+
+# technique 별 호출 수, 지운 후보 수, 확정한 cell 수, 시간
+# counts 는 (technique, "calls" / "eliminated" / "placed" / ...) -> 횟수, seconds 는 technique -> 초
+# 상위 technique 의 시간은 안에서 부른 technique 시간을 포함한다 (subsection > naked3, try > probe)
+class SolveStats:
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.seconds = defaultdict(float)
+
+    def merge(self, other):
+        if isinstance(other, dict):
+            other = SolveStats.from_dict(other)
+        for key, count in other.counts.items():
+            self.counts[key] += count
+        for key, seconds in other.seconds.items():
+            self.seconds[key] += seconds
+        return self
+
+    def as_dict(self):
+        ret = defaultdict(dict)
+        for (technique, name), count in self.counts.items():
+            ret[technique][name] = count
+        for technique, seconds in self.seconds.items():
+            ret[technique]["seconds"] = seconds
+        return dict(ret)
+
+    @staticmethod
+    def from_dict(data):
+        stats = SolveStats()
+        for technique, values in data.items():
+            for name, value in values.items():
+                if name == "seconds":
+                    stats.seconds[technique] += value
+                else:
+                    stats.counts[(technique, name)] += value
+        return stats
+
+    def report(self):
+        lines = []
+        for technique, values in sorted(self.as_dict().items()):
+            lines.append("%-12s " % technique + " ".join("%s=%s" % (name, ("%.4f" % value) if name == "seconds" else value) for name, value in sorted(values.items())))
+        return "\n".join(lines)
+
+# solve() 가 넘기면 안 되는 한도. deadline 은 time.time() 기준의 시각
+# 한도는 solve() 의 pass 사이와 probe 직전에만 확인하므로 (상태가 항상 일관되게) 조금 넘길 수 있다
+# probe 안 (가정 중) 에서는 deadline 만 본다. 시작한 probe 는 끝까지 가므로 max_probes 가 1 이어도 매번 probe 하나는 끝난다
+# eliminated 는 판에 남은 (되돌리지 않은) 제거만 센다
+class SolveBudget:
+    def __init__(self, deadline=None, max_probes=None, max_eliminations=None):
+        self.deadline = deadline
+        self.max_probes = max_probes
+        self.max_eliminations = max_eliminations
+        self.probes = 0
+        self.eliminated = 0
+        # 한도에 걸렸으면 "deadline" / "probes" / "eliminations"
+        self.exhausted = None
+
+    @staticmethod
+    def from_limits(time_limit=None, max_probes=None, max_eliminations=None):
+        if time_limit is None and max_probes is None and max_eliminations is None:
+            return None
+        deadline = time.time() + time_limit if time_limit is not None else None
+        return SolveBudget(deadline, max_probes, max_eliminations)
+
+    def check(self, deadline_only=False):
+        if self.deadline is not None and time.time() >= self.deadline:
+            raise BudgetExceeded("deadline")
+        if deadline_only:
+            return
+        if self.max_probes is not None and self.probes >= self.max_probes:
+            raise BudgetExceeded("probes")
+        if self.max_eliminations is not None and self.eliminated >= self.max_eliminations:
+            raise BudgetExceeded("eliminations")
+
+    def as_dict(self):
+        return {"probes": self.probes, "eliminated": self.eliminated, "exhausted": self.exhausted}
+
+class BudgetExceeded(Exception):
+    pass
+
+# solve() 의 작업 목록. technique 별로 마지막으로 돌린 뒤 바뀐 cell / unit 만 들고 있어서
+# 바뀐 것이 없으면 그 technique 은 아무 일도 하지 않는다
+# unit_keys 를 주면 그 unit 들만 처음 목록에 넣고, subset_seen 을 주면 그 복사본에서 시작한다
+# (probe 가 바깥 fixpoint 에서 바뀐 곳만 이어서 볼 때)
+class Scheduler:
+    def __init__(self, cell_keys, geometry=standard, unit_keys=None, subset_seen=None):
+        if unit_keys is None:
+            unit_keys = geometry.unit_keys
+        self.geometry = geometry
+        self.cells = set(cell_keys)                 # solve_unique
+        self.unique_units = set(unit_keys)          # solve_unique_unit
+        self.subsection_units = set(unit_keys)      # solve_subsection
+        self.subset_seen = dict(subset_seen or {})  # solve_subsection 의 seen
+        self.patterns = len(self.unique_units) > 0  # solve_patterns 는 판 전체를 보므로 바뀐 것이 있는지만 센다
+
+    # Sudoku.take_changed() 로 받은 cell 들을 각 technique 의 목록에 넣는다
+    def add_changed(self, changed, unknown_cells):
+        if changed:
+            self.patterns = True
+        for cell_key in changed:
+            if cell_key in unknown_cells:
+                self.cells.add(cell_key)
+            units = self.geometry.cell_units[cell_key]
+            self.unique_units.update(units)
+            self.subsection_units.update(units)
+
+    def take_cells(self, unknown_cells):
+        cells = [cell_key for cell_key in unknown_cells if cell_key in self.cells]
+        self.cells.clear()
+        return cells
+
+    # unit_keys 순서(row, col, rect)로 꺼낸다
+    def take_units(self, dirty):
+        units = [unit_key for unit_key in self.geometry.unit_keys if unit_key in dirty]
+        dirty.clear()
+        return units
+
+# Sudoku.solve_fish 의 크기별 이름 (event / stats 의 technique)
+fish_names = {2: "xwing", 3: "swordfish", 4: "jellyfish"}
+
+# 풀이 단계(event)를 받는 sink 들. Sudoku.set_sink 로 붙인다
+# event 는 technique, unit, cells, values, eliminations 를 가진 dict
+class NullSink:
+    active = False
+
+    def emit(self, event):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+class ListSink(NullSink):
+    active = True
+
+    def __init__(self):
+        self.events = []
+
+    def emit(self, event):
+        self.events.append(event)
+
+# event 를 한 줄에 하나씩 JSON 으로 쓴다. buffer_size 개씩 모아서 한 번에 write 한다
+class JsonLinesSink(NullSink):
+    active = True
+
+    def __init__(self, path_or_file, buffer_size=1024):
+        if isinstance(path_or_file, str):
+            self.file = open(path_or_file, "w")
+            self.own_file = True
+        else:
+            self.file = path_or_file
+            self.own_file = False
+        self.buffer_size = buffer_size
+        self.buffer = []
+
+    def emit(self, event):
+        self.buffer.append(json.dumps(event, separators=(",", ":")))
+        if len(self.buffer) >= self.buffer_size:
+            self.flush()
+
+    def flush(self):
+        if self.buffer:
+            self.file.write("\n".join(self.buffer) + "\n")
+            self.buffer = []
+        self.file.flush()
+
+    def close(self):
+        self.flush()
+        if self.own_file:
+            self.file.close()
+
+# size 는 한 변의 칸 수 (9, 16, 25, ...). 판 크기에 따른 테이블은 모두 self.geometry 에 있다
 class Sudoku:
-    def __init__(self, init=True):
+    def __init__(self, init=True, engine="set", gui=True, size=9):
+        if engine not in engines:
+            raise Exception("Unknown engine %s" % str(engine))
+        self.engine = engine
+        self.cell_class = engines[engine]
+        self.geometry = geometry_for(size)
+        if engine == "mask":
+            self.masks = [self.geometry.all_values_mask] * self.geometry.cell_count
+            self.values = [0] * self.geometry.cell_count
+            self.recent = [0] * self.geometry.cell_count
         self.canvas = None
         self.canvas_units = dict()
         self.canvas_interests = dict()
         self.do_print = True
+        # 출력이나 화면이 붙어 있을 때만 설명 문자열, 표시용 상태를 만든다 (update_observed)
+        self.observed = True
+        # sink 가 event 를 받을 때만 event 를 만든다. 표시용 상태와는 상관없이 지운 후보로 바로 만든다
+        self.traced = False
+        # enable_stats() 를 부르면 SolveStats. 지금 돌고 있는 technique 이름은 self.technique
+        self.stats = None
+        # solve(budget=...) 동안의 SolveBudget
+        self.budget = None
+        self.technique = "input"
+        self.sink = None
+        self.trace_id = None
         self.set_single_in_progress = None
         self.all_cells = dict()
         self.known_cells = dict()
         self.unknown_cells = dict()
         self.changed = set()
+        # push_checkpoint 이후의 변경 기록 (undo log). checkpoint 가 없으면 None
+        self.trail = None
+        self.checkpoints = []
+        # unit 별 아직 안 풀린 cell 수
+        self.unsolved_count = dict.fromkeys(self.geometry.unit_keys, 0)
+        # (cell key, value) -> (probe 전 후보 상태, probe 후 후보 상태 또는 None, 실패 메시지). probe() 참고
+        self.probe_memo = dict()
+        # probe 단계 수 (1: 가정 하나, 2 이상: probe 안에서 후보가 둘인 cell 을 한 단계 더 가정). set_probe_depth() 참고
+        self.probe_depth = 1
+        self.deep_probes = 0
+        self.deep_probe_limit = 20000
+        # 지금 가정하고 있는 (cell key, value) 들 (바깥 probe 부터)
+        self.probe_path = []
+        # 함께 성립할 수 없는 가정 묶음 (frozenset). literal (cell key, value) -> 그 literal 이 든 nogood list
+        self.nogoods = defaultdict(list)
+        self.nogood_list = []
+        self.max_nogoods = 4096
+        # set_probe_pool() 참고
+        self.probe_pool = None
+        self.probe_window = 1
+        # 한도에 걸려 멈춘 solve(recursion=True) 의 Scheduler 와 그때 보던 Try 의 cell 순번 (MRV 순서)
+        # 다음 solve() 와 snapshot() 이 여기서 이어간다
+        self.scheduler = None
+        self.try_position = 0
+        # solve_try 도중에만 채워지는 바깥 solve 의 subset seen. probe 안의 solve 가 이어서 쓴다
+        self.probe_seen = None
+        # False 면 solve_patterns 를 건너뛴다 (비교용)
+        self.patterns = True
         self.wait_user = False
         if init:
-            try:
-                import tkinter
-                self.canvas = tkinter.Canvas(width=cell_size*12, height=cell_size*12)
-                for row in range(3):
-                    for col in range(3):
-                        key = (-row-1, -col-1)
-                        rect_size = cell_size * 3
-                        pos_x = col * rect_size + cell_size - cell_size + cell_margin
-                        pox_y = row * rect_size + cell_size - cell_size + cell_margin
-                        self.canvas.create_rectangle(pos_x, pox_y, pos_x + rect_size, pox_y + rect_size, outline="black", width=3) # Won't be changed
-                        obj = self.canvas.create_rectangle(pos_x, pox_y, pos_x + rect_size, pox_y + rect_size, state="hidden", fill="lightblue", width=5, outline="purple")
-                        self.canvas_units[key] = obj
-                for row in range(1, 10):
-                    key = (-row, 0)
-                    pos_x = cell_size - cell_size + cell_margin
-                    pox_y = row * cell_size - cell_size + cell_margin
-                    obj = self.canvas.create_rectangle(pos_x, pox_y, pos_x + cell_size*9, pox_y + cell_size, state="hidden", fill="lightblue", width=5, outline="purple")
-                    self.canvas_units[key] = obj
-                for col in range(1, 10):
-                    key = (0, -col)
-                    pos_x = col * cell_size - cell_size + cell_margin
-                    pox_y = cell_size - cell_size + cell_margin
-                    obj = self.canvas.create_rectangle(pos_x, pox_y, pos_x + cell_size, pox_y + cell_size*9, state="hidden", fill="lightblue", width=5, outline="purple")
-                    self.canvas_units[key] = obj
-                self.canvas.pack()
-            except:
-                pass
-            for row in range(1, 10):
-                for col in range(1, 10):
-                    key = (row, col)
-                    cell = Cell(self, key)
-                    self.all_cells[key] = cell
-                    self.unknown_cells[key] = cell
-                
-                for row in range(1,10):
-                    for col in range(1,10):
-                        key = (row, col)
+            if gui:
+                self.create_canvas()
+            # key tuple 은 판마다 새로 만들지 않고 Geometry 의 것을 같이 쓴다
+            for key in self.geometry.cell_keys:
+                cell = self.cell_class(self, key)
+                self.all_cells[key] = cell
+                self.unknown_cells[key] = cell
+            self.unsolved_count = dict.fromkeys(self.geometry.unit_keys, self.geometry.size)
 
         self.updated_cells = set() # to compare with new updates
+        self.update_observed()
         
         # try:
         #     import tkinter
@@ -181,6 +749,63 @@ class Sudoku:
         # except:
         #     self.gui = None
     
+    def update_observed(self):
+        self.observed = self.do_print or self.canvas is not None
+        self.traced = self.sink is not None and self.sink.active
+
+    # trace_id 가 있으면 모든 event 에 "puzzle" 로 들어간다
+    def set_sink(self, sink, trace_id=None):
+        self.sink = sink
+        self.trace_id = trace_id
+        self.update_observed()
+
+    # eliminations 는 (cell key, 지워진 후보 mask) 의 list
+    def emit(self, technique, unit=None, cells=(), values=(), eliminations=()):
+        if not self.traced:
+            return
+        event = {
+            "technique": technique,
+            "unit": unit,
+            "cells": list(cells),
+            "values": sorted(values),
+            "eliminations": [(key, self.geometry.mask_values[mask]) for (key, mask) in eliminations],
+        }
+        if self.trace_id is not None:
+            event["puzzle"] = self.trace_id
+        self.sink.emit(event)
+
+    def create_canvas(self):
+        try:
+            import tkinter
+            box = self.geometry.box
+            size = self.geometry.size
+            self.canvas = tkinter.Canvas(width=cell_size*(size+3), height=cell_size*(size+3))
+            for row in range(box):
+                for col in range(box):
+                    key = (-row-1, -col-1)
+                    rect_size = cell_size * box
+                    pos_x = col * rect_size + cell_size - cell_size + cell_margin
+                    pox_y = row * rect_size + cell_size - cell_size + cell_margin
+                    self.canvas.create_rectangle(pos_x, pox_y, pos_x + rect_size, pox_y + rect_size, outline="black", width=3) # Won't be changed
+                    obj = self.canvas.create_rectangle(pos_x, pox_y, pos_x + rect_size, pox_y + rect_size, state="hidden", fill="lightblue", width=5, outline="purple")
+                    self.canvas_units[key] = obj
+            for row in range(1, size+1):
+                key = (-row, 0)
+                pos_x = cell_size - cell_size + cell_margin
+                pox_y = row * cell_size - cell_size + cell_margin
+                obj = self.canvas.create_rectangle(pos_x, pox_y, pos_x + cell_size*size, pox_y + cell_size, state="hidden", fill="lightblue", width=5, outline="purple")
+                self.canvas_units[key] = obj
+            for col in range(1, size+1):
+                key = (0, -col)
+                pos_x = col * cell_size - cell_size + cell_margin
+                pox_y = cell_size - cell_size + cell_margin
+                obj = self.canvas.create_rectangle(pos_x, pox_y, pos_x + cell_size, pox_y + cell_size*size, state="hidden", fill="lightblue", width=5, outline="purple")
+                self.canvas_units[key] = obj
+            self.canvas.pack()
+        except:
+            pass
+        self.update_observed()
+
     def clear_marks(self):
         self.updated_cells.clear()
         if self.canvas:
@@ -190,15 +815,24 @@ class Sudoku:
                 self.canvas.itemconfigure(obj, state="hidden")
         
         for cell in self.all_cells.values():
-            cell.recently_removed.clear()
+            cell.clear_recent()
             cell.update_text()
 
     def mark_changed(self, cell_key):
         self.changed.add(cell_key)
-        self.updated_cells.add(cell_key)
+        if self.observed:
+            self.updated_cells.add(cell_key)
+
+    def mark_solved(self, cell_key):
+        self.mark_changed(cell_key)
+        for unit_key in self.geometry.cell_units[cell_key]:
+            self.unsolved_count[unit_key] -= 1
         
     
     def wait_for_next_setep(self, used_group=None, interest_cells=set(), interest_values=set(), interest_name=""):
+        if self.checkpoints:
+            # 가정해 보는 중에는 화면/표시 상태를 건드리지 않는다
+            return
         if self.wait_user and self.canvas is not None:
             if len(interest_cells) > 0 and len(interest_values)>0:
                 if len(interest_name) > 0:
@@ -231,6 +865,226 @@ class Sudoku:
     def take_unknown_keys(self):
         return set(self.unknown_cells.keys())
 
+    # 지금 상태를 기억해 두고, 이후 변경을 trail 에 쌓는다
+    def push_checkpoint(self):
+        if self.trail is None:
+            self.trail = []
+        self.checkpoints.append((len(self.trail), set(self.changed), set(self.updated_cells)))
+
+    # 마지막 push_checkpoint 시점으로 되돌린다
+    # probe 밖에서 되돌리면 nogood 이 기대던 후보가 다시 살아날 수 있으므로 nogood 을 버린다
+    def rollback(self):
+        (mark, changed, updated_cells) = self.checkpoints.pop()
+        trail = self.trail
+        reopened = False
+        while len(trail) > mark:
+            (cell, mask, value) = trail.pop()
+            if value == 0 and cell.value != 0:
+                del self.known_cells[cell.key]
+                for unit_key in self.geometry.cell_units[cell.key]:
+                    self.unsolved_count[unit_key] += 1
+                reopened = True
+            cell.restore(mask, value)
+        if reopened:
+            # unknown_cells 는 항상 all_cells 순서를 유지한다 (Try 의 정렬 순서가 여기에 의존)
+            self.unknown_cells = {key: cell for key, cell in self.all_cells.items() if key not in self.known_cells}
+        self.changed = changed
+        self.updated_cells = updated_cells
+        if not self.checkpoints:
+            self.trail = None
+        if not self.probe_path and self.nogood_list:
+            self.nogoods.clear()
+            self.nogood_list = []
+
+    # cell_keys 순서의 후보 mask tuple
+    def candidate_state(self):
+        if self.engine == "mask":
+            return tuple(self.masks)
+        return tuple(cell.mask for cell in self.all_cells.values())
+
+    # cell_key 에 value 를 가정하고 recursion 없이 풀어본 뒤 되돌린다
+    # 모순이면 Exception 이 그대로 올라가고, 아니면 check_keys 의 impossible mask 를 돌려준다
+    # solve(recursion=False) 는 후보를 지우기만 하는 fixpoint 이므로 결과를 probe_memo 에 남겨 두고,
+    # 지금 상태가 그때 상태의 부분집합이면서 그때 결과를 포함하면 (그 사이에 지운 후보를 probe 도 지웠으면) 다시 풀지 않는다
+    # 실패한 probe 는 지금 상태가 그때 상태의 부분집합이기만 하면 여전히 실패한다
+    # 부분집합이지만 그때 결과를 포함하지 않으면 (다음 Try 바퀴처럼) 그때 지운 후보는 가정에서 나온 결론이라 지금도 성립하므로
+    # 그것을 먼저 지우고 풀어서, 처음부터 다시 퍼뜨리지 않고 그 사이에 바뀐 곳만 더 본다 (fixpoint 는 같다)
+    # depth 가 2 이상이면 풀어본 뒤 probe_deeper 로 한 단계 더 가정해 본다 (memo 는 depth 별로 따로 둔다)
+    # 가정 중에 모순이 나면 지금까지의 가정 (probe_path) 을 nogood 으로 남긴다
+    def probe(self, cell_key, value, check_keys, depth=1):
+        memo_key = (cell_key, value) if depth == 1 else (cell_key, value, depth)
+        current = self.candidate_state()
+        memo = self.lookup_probe(memo_key, current)
+        if memo is not None:
+            self.count_probe("memo_hits")
+            (after, message) = memo
+            if after is None:
+                raise Exception(message)
+            all_mask = self.geometry.all_values_mask
+            return {check_key: all_mask & ~after[self.geometry.cell_index(check_key)] for check_key in check_keys}
+        nogood = self.violated_nogood(cell_key, value)
+        if nogood is not None:
+            self.count_probe("nogood_prunes")
+            raise Exception("Nogood %s" % str(sorted(nogood)))
+        if self.budget is not None:
+            self.budget.check(len(self.probe_path) > 0)
+            self.budget.probes += 1
+        earlier = self.probe_memo.get(memo_key)
+        if earlier is not None and (earlier[1] is None or not all(now & ~before == 0 for (now, before) in zip(current, earlier[0]))):
+            earlier = None
+        saved = (self.do_print, self.wait_user, self.canvas, self.observed, self.traced, self.sink)
+        self.push_checkpoint()
+        self.probe_path.append((cell_key, value))
+        self.do_print = False
+        self.wait_user = False
+        self.canvas = None
+        self.observed = False
+        self.traced = False
+        self.sink = None
+        try:
+            pending = set(self.changed)
+            self.set_cell(cell_key, value)
+            if earlier is not None:
+                self.resume_probe(current, earlier[1], pending)
+            self.propagate()
+            if depth > 1:
+                self.probe_deeper(depth - 1)
+            self.probe_memo[memo_key] = (current, self.candidate_state(), None)
+            return {check_key: self.geometry.all_values_mask & ~self.all_cells[check_key].mask for check_key in check_keys}
+        except BudgetExceeded:
+            raise
+        except Exception as e:
+            self.probe_memo[memo_key] = (current, None, str(e))
+            if len(self.probe_path) > 1:
+                self.add_nogood(frozenset(self.probe_path))
+            raise
+        finally:
+            (self.do_print, self.wait_user, self.canvas, self.observed, self.traced, self.sink) = saved
+            self.rollback()
+            self.probe_path.pop()
+
+    # 그때 probe 의 결과 after 를 지금 판 (current, probe 전 상태) 에 옮겨 놓는다. after 는 fixpoint 이므로
+    # 그 뒤 바뀐 cell (current 가 after 의 후보를 지운 곳) 만 changed 로 남겨 propagate 가 그 unit 만 보게 한다
+    # pending 은 가정하기 전부터 changed 에 있던 cell
+    def resume_probe(self, current, after, pending):
+        self.count_probe("memo_resumes")
+        geometry = self.geometry
+        for cell in list(self.unknown_cells.values()):
+            cell.remove_mask(cell.mask & ~after[geometry.cell_index(cell.key)])
+        # after 에서 이미 놓였던 cell 만 놓는다 (그 peer 에서는 after 가 벌써 지웠다). 새로 하나 남은 cell 은 propagate 가 놓는다
+        for cell in list(self.unknown_cells.values()):
+            mask = after[geometry.cell_index(cell.key)]
+            if popcount(mask) == 1 and cell.mask == mask:
+                cell.set_value(geometry.mask_values[mask][0])
+        pending.update(key for (index, key) in enumerate(geometry.cell_keys) if current[index] & after[index] != after[index])
+        self.changed = pending
+
+    # probe_memo 의 결과를 current 상태에서 그대로 쓸 수 있으면 (probe 후 후보 상태 또는 None, 실패 메시지), 아니면 None
+    def lookup_probe(self, memo_key, current):
+        memo = self.probe_memo.get(memo_key)
+        if memo is None or not all(now & ~before == 0 for (now, before) in zip(current, memo[0])):
+            return None
+        (_, after, message) = memo
+        if after is not None and not all(now & after_mask == after_mask for (now, after_mask) in zip(current, after)):
+            return None
+        return (after, message)
+
+    def count_probe(self, name):
+        if self.stats is not None:
+            self.stats.counts[("probe", name)] += 1
+
+    # probe 안에서 recursion 없이 풀고, nogood 으로 지울 것이 있으면 지운 뒤 다시 푼다
+    def propagate(self):
+        while True:
+            self.solve(recursion=False)
+            if not self.nogood_list or not self.apply_nogoods():
+                break
+
+    # 후보가 둘인 cell 의 두 값을 depth 단계로 가정해 본다 (probe 안에서만 부른다)
+    # 모순인 값은 지우고 다시 풀며, 두 값이 모두 모순이면 지금 가정이 모순이므로 Exception 을 올린다
+    # 판 하나에서 deep_probe_limit 번을 넘기면 더 들어가지 않는다 (가정이 약해질 뿐 틀리지는 않는다)
+    def probe_deeper(self, depth):
+        updated = True
+        while updated:
+            updated = False
+            for (cell_key, cell) in list(self.unknown_cells.items()):
+                if cell.count() != 2:
+                    continue
+                failed = 0
+                for value in self.geometry.mask_values[cell.mask]:
+                    if self.deep_probes >= self.deep_probe_limit:
+                        return
+                    self.deep_probes += 1
+                    self.count_probe("deep")
+                    try:
+                        self.probe(cell_key, value, (), depth)
+                    except BudgetExceeded:
+                        raise
+                    except Exception:
+                        failed |= value_to_bit(value)
+                if failed == cell.mask:
+                    raise Exception("No possible value at cell %s under %s" % (str(cell_key), str(self.probe_path)))
+                if failed:
+                    cell.remove_mask(failed)
+                    self.propagate()
+                    updated = True
+                    break
+
+    # literal 을 하나 더 놓으면 모든 literal 이 놓이는 nogood (없으면 None)
+    def violated_nogood(self, cell_key, value):
+        all_cells = self.all_cells
+        for nogood in self.nogoods.get((cell_key, value), ()):
+            if all(all_cells[key].value == other for (key, other) in nogood if key != cell_key):
+                return nogood
+        return None
+
+    # 이미 있는 nogood 의 부분집합이 아닐 때만 넣고, 새 nogood 을 포함하는 (더 긴) nogood 은 지운다
+    def add_nogood(self, nogood):
+        for literal in nogood:
+            for other in self.nogoods.get(literal, ()):
+                if other <= nogood:
+                    return
+        if len(self.nogood_list) >= self.max_nogoods:
+            return
+        supersets = set(other for literal in nogood for other in self.nogoods.get(literal, ()) if nogood < other)
+        if supersets:
+            self.nogood_list = [other for other in self.nogood_list if other not in supersets]
+            for other in supersets:
+                for literal in other:
+                    self.nogoods[literal].remove(other)
+        self.nogood_list.append(nogood)
+        for literal in nogood:
+            self.nogoods[literal].append(nogood)
+        self.count_probe("nogoods")
+
+    # 하나만 빼고 모두 놓인 nogood 은 남은 literal 을 후보에서 지운다. 모두 놓였으면 모순
+    def apply_nogoods(self):
+        updated = False
+        all_cells = self.all_cells
+        for nogood in list(self.nogood_list):
+            pending = None
+            for (key, value) in nogood:
+                cell = all_cells[key]
+                if cell.value == value:
+                    continue
+                if cell.value != 0 or not cell.mask & value_to_bit(value) or pending is not None:
+                    # 이미 다른 값이거나 후보가 아니면 성립할 수 없는 nogood, 둘 이상 남았으면 아직 모른다
+                    pending = False
+                    break
+                pending = (key, value)
+            if pending is None:
+                raise Exception("Nogood %s" % str(sorted(nogood)))
+            if pending:
+                (key, value) = pending
+                if self.traced:
+                    self.emit("nogood", cells=[literal[0] for literal in sorted(nogood)], values=[value], eliminations=[(key, value_to_bit(value))])
+                if self.observed:
+                    self.print("Nogood %s: removing %d from %s" % (str(sorted(nogood)), value, str(key)))
+                if all_cells[key].remove_mask(value_to_bit(value)):
+                    self.count_probe("nogood_eliminations")
+                    updated = True
+        return updated
+
     # 변경된 cell 좌표 가져오기
     def take_changed(self):
         prev = self.changed
@@ -249,22 +1103,22 @@ class Sudoku:
 
     def is_row_index(self, row_key):
         (row, col) = row_key
-        assert (-row) in range(1, 10)
+        assert (-row) in range(1, self.geometry.size + 1)
         col == 0 and row < 0
 
     def is_col_index(self, col_key):
         (row, col) = col_key
-        assert (-col) in range(1, 10)
+        assert (-col) in range(1, self.geometry.size + 1)
         row == 0 and col < 0
     
     def is_rect_index(self, rect_key):
         (row, col) = rect_key
-        assert (-row) in range(1, 4) and (-col) in range(1, 4)
+        assert (-row) in range(1, self.geometry.box + 1) and (-col) in range(1, self.geometry.box + 1)
         row < 0 and col < 0
 
     def is_cell_index(self, cell_key):
         (row, col) = cell_key
-        assert row in range(1, 10) and col in range(1, 10)
+        assert row in range(1, self.geometry.size + 1) and col in range(1, self.geometry.size + 1)
         row > 0 and col > 0
     
     def get_cell(self, key):
@@ -274,30 +1128,9 @@ class Sudoku:
     
     # 어떤 종류의 유닛이던 간에 그 item 을 리턴한다
     def _get_unit_cell_keys(self, unit_key, base_cells):
-        (row, col) = unit_key
-        if row == 0 and col == 0:
+        if unit_key not in self.geometry.unit_cells:
             raise Exception("Invalid unit key")
-        elif row == 0:
-            # col
-            for row in range(1, 10):
-                if (row, -col) in base_cells:
-                    yield (row, -col)
-            return
-        elif col == 0:
-            # row
-            for col in range(1, 10):
-                if (-row, col) in base_cells:
-                    yield (-row, col)
-            return
-        else:
-            # rect
-            for row_idx in range(1, 4):
-                for col_idx in range(1, 4):
-                    new_row = (-row-1)*3 + row_idx
-                    new_col = (-col-1)*3 + col_idx
-                    if (new_row, new_col) in base_cells:
-                        yield (new_row, new_col)
-            return
+        return [key for key in self.geometry.unit_cells[unit_key] if key in base_cells]
     
     # 어떤 종류의 유닛이던 간에 그 item 을 리턴한다
     def _get_unit_string(self, unit_key):
@@ -315,8 +1148,8 @@ class Sudoku:
             return "rect %d %d" % (-row, -col)
     # 어떤 종류의 유닛이던 간에 그 item 을 리턴한다
     def get_unsolved_unit_cell_keys(self, unit_key):
-        for x in self._get_unit_cell_keys(unit_key, self.unknown_cells):
-            yield x
+        unknown_cells = self.unknown_cells
+        return [key for key in self.geometry.unit_cells[unit_key] if key in unknown_cells]
 
     # Cell 의 possible 이 1개인지 검사한다.
     # 이 외 작업은 수행하지 않는다.
@@ -326,18 +1159,23 @@ class Sudoku:
         updated_once = False
         for cell_key in cell_keys:
             cell = self.get_cell(cell_key)
-            if len(cell.possible) == 1:
+            if cell.count() == 1:
                 value = list(cell.possible)[0]
                 if self.set_cell(cell.key, value):
-                    self.print("unique possiblity in a cell", cell.key, value)
                     updated_once = True
-                    self.wait_for_next_setep(interest_cells=[cell_key], interest_name="Uniq(Cell)", interest_values=[value])
+                    if self.traced:
+                        self.emit("naked_single", cells=[cell_key], values=[value])
+                    if self.observed:
+                        self.print("unique possiblity in a cell", cell.key, value)
+                        self.wait_for_next_setep(interest_cells=[cell_key], interest_name="Uniq(Cell)", interest_values=[value])
         return updated_once
     
     # 각 unit 에서 유일하게 한번 가능한 것을 확정시킴
     def solve_unique_unit(self, unit_keys):
         updated_once = False
         for unit_key in unit_keys:
+            if self.unsolved_count[unit_key] == 0:
+                continue
             updated = False
             count_dict = defaultdict(list)
             for cell_key in self.get_unsolved_unit_cell_keys(unit_key):
@@ -345,198 +1183,1516 @@ class Sudoku:
                 for possible in cell.possible:
                     count_dict[possible].append(cell.key)
             print_args = []
-            interest_cells = set()
             for possible, keys in count_dict.items():
                 if len(keys) == 1:
-                    print_args.append((keys[0], possible))
+                    if self.observed:
+                        print_args.append((keys[0], possible))
                     if self.set_cell(keys[0], possible):
-                        interest_cells.add(keys[0])
-                        self.wait_for_next_setep(used_group=unit_key, interest_cells=keys, interest_name="Uniq(Unit)", interest_values=[possible])
+                        if self.traced:
+                            self.emit("hidden_single", unit=unit_key, cells=keys, values=[possible])
+                        if self.observed:
+                            self.wait_for_next_setep(used_group=unit_key, interest_cells=keys, interest_name="Uniq(Unit)", interest_values=[possible])
                         
                         updated_once = True
                         updated = True
-            if updated:
+            if updated and self.observed:
                 self.print("unique possiblity in a unit", self._get_unit_string(unit_key))
                 for key, possible in print_args:
                     self.print("\t", key, possible)
         return updated_once
     
+    def enable_stats(self, stats=None):
+        if stats is None:
+            stats = SolveStats()
+        self.stats = stats
+        return stats
+
+    # stats 가 켜져 있으면 technique 이름으로 호출 수와 시간을 잰다
+    # 가정(probe) 안에서 일어난 일은 모두 바깥의 "probe" 몫으로 센다
+    def run_technique(self, technique, method, *args):
+        stats = self.stats
+        if stats is None or (self.checkpoints and technique != "probe"):
+            return method(*args)
+        previous = self.technique
+        self.technique = technique
+        start = time.perf_counter()
+        try:
+            return method(*args)
+        finally:
+            stats.seconds[technique] += time.perf_counter() - start
+            stats.counts[(technique, "calls")] += 1
+            self.technique = previous
+
     def set_print(self, flag=True):
         self.do_print = flag
+        self.update_observed()
     
     def set_wait_user(self, flag=True):
         self.wait_user = flag
+
+    def set_patterns(self, flag=True):
+        self.patterns = flag
+
+    # Try 의 probe 를 pool (concurrent.futures 의 Executor, make_probe_pool 참고) 에서 나눠 돌린다. None 이면 한 process 에서
+    # window 는 한 번에 보내 두는 cell 수 (보통 make_probe_pool 이 돌려준 worker 수)
+    def set_probe_pool(self, pool, window):
+        self.probe_pool = pool
+        self.probe_window = max(1, window)
+
+    # Try 의 probe 를 depth 단계까지 가정해 본다. limit 은 이 판에서 2 단계 이상 들어가는 probe 의 총 수
+    # 전체 한도는 solve() 의 budget (SolveBudget) 이 모든 단계의 probe 를 세어서 건다
+    def set_probe_depth(self, depth=1, limit=None):
+        self.probe_depth = depth
+        if limit is not None:
+            self.deep_probe_limit = limit
     
     def print(self, *args, **kwargs):
         if self.do_print:
             print(*args, **kwargs)
     
-    def solve_subsection(self, unit_keys):
+    # seen 에는 (unit, naked/hidden, 크기) 별로 마지막에 다 훑었을 때의 mask 를 남겨 둔다
+    # 그때와 달라진 cell(naked) / 숫자 위치(hidden) 가 하나도 없는 조합은 다시 볼 필요가 없다
+    def solve_subsection(self, unit_keys, seen=None):
+        if seen is None:
+            seen = dict()
         updated_once = False
         for unit_key in unit_keys:
-            unsolved_items = list(self.get_unsolved_unit_cell_keys(unit_key))
+            # 남은 cell 이 2개 이하면 subset 이 나올 수 없다
+            if self.unsolved_count[unit_key] < 3:
+                continue
+            unsolved_items = self.get_unsolved_unit_cell_keys(unit_key)
             
-            all_possibles = set()
+            masks = dict()
+            all_possibles = 0
             for cell_key in unsolved_items:
-                cell = self.get_cell(cell_key)
-                all_possibles = all_possibles.union(cell.possible)
+                mask = self.get_cell(cell_key).mask
+                masks[cell_key] = mask
+                all_possibles |= mask
             for select_count in range(2, 5):
-                while True:
-                    updated = False
-                    if select_count < len(unsolved_items):
-                        # Naked subsets
-                        for selected in itertools.combinations(unsolved_items, select_count):
-                            possible_set = set()
-                            for cell_key in selected:
-                                cell = self.get_cell(cell_key)
-                                possible_set = possible_set.union(cell.possible)
-                            if len(possible_set) == select_count:
-                                removed_list = []
-                                for cell_key in unsolved_items:
-                                    if cell_key not in selected:
-                                        cell = self.get_cell(cell_key)
-                                        if cell.remove_possible(possible_set):
-                                            removed_list.append(cell_key)
-                                            updated_once = True
-                                            updated = True
-                                if len(removed_list) > 0:
-                                    self.print("Naked subset: possible union set of %s is %s" % (str(selected), str(possible_set)))
-                                    for cell_key in removed_list:
-                                        self.print("\tRemoving from others(%s)" % (str(cell_key)))
-                                    self.wait_for_next_setep(used_group=unit_key, interest_cells=selected, interest_name="Naked({})".format(select_count), interest_values=possible_set)
-                    if not updated:
-                        break
-                    if updated:
+                if select_count < len(unsolved_items):
+                    if self.run_technique("naked%d" % select_count, self.solve_naked_subset, unit_key, unsolved_items, masks, select_count, seen):
+                        return True
+                if select_count < popcount(all_possibles):
+                    if self.run_technique("hidden%d" % select_count, self.solve_hidden_subset, unit_key, masks, all_possibles, select_count, seen):
                         return True
-                while True:
-                    updated = False
-                    if select_count < len(all_possibles):
-                        # Hidden subsets
-                        for selected in itertools.combinations(all_possibles, select_count):
-                            cell_with_selected = set()
-                            selected = set(selected)
-                            for cell_key in unsolved_items:
-                                cell = self.get_cell(cell_key)
-                                if len(selected.intersection(cell.possible)) > 0:
-                                    cell_with_selected.add(cell_key)
-                            if len(cell_with_selected) == select_count:
-                                removed_list = []
-                                for cell_key in cell_with_selected:
-                                    cell = self.get_cell(cell_key)
-                                    removing = cell.possible.difference(selected)
-                                    if cell.remove_possible(removing):
-                                        removed_list.append((cell_key, removing))
-                                        updated_once = True
-                                        updated = True
-                                if len(removed_list) > 0:
-                                    self.print("Hidden subset: values %s exists only in %s" % (str(selected), str(cell_with_selected)))
-                                    for (cell_key, removing) in removed_list:
-                                        self.print("\tRemoving %s from %s" % (str(removing), str(cell_key)))
-                                    self.wait_for_next_setep(used_group=unit_key, interest_cells=cell_with_selected, interest_name="Hidden({})".format(select_count), interest_values=selected)
-                    if not updated:
-                        break
-                    if updated:
-                        return True;
         return updated_once
+
+    # unsolved_items 중 select_count 개의 후보 합집합이 select_count 개면 나머지 cell 에서 그 후보를 지운다
+    # masks 는 solve_subsection 과 같이 쓰며 지운 결과로 갱신한다
+    def solve_naked_subset(self, unit_key, unsolved_items, masks, select_count, seen):
+        stats = self.stats
+        updated = False
+        seen_key = (unit_key, "naked", select_count)
+        last = seen.get(seen_key, {})
+        seen[seen_key] = dict(masks)
+        changed = set(cell_key for cell_key in unsolved_items if last.get(cell_key) != masks[cell_key])
+        if stats is not None:
+            stats.counts[(self.technique, "combinations")] += comb(len(unsolved_items), select_count)
+        for selected in subset_combinations(unsolved_items, masks, select_count, changed):
+            if stats is not None:
+                stats.counts[(self.technique, "checked")] += 1
+            possible_mask = 0
+            for cell_key in selected:
+                possible_mask |= masks[cell_key]
+            if popcount(possible_mask) == select_count:
+                removed_list = []
+                for cell_key in unsolved_items:
+                    if cell_key not in selected:
+                        cell = self.get_cell(cell_key)
+                        if cell.remove_mask(possible_mask):
+                            removed_list.append((cell_key, masks[cell_key] & possible_mask))
+                            masks[cell_key] = cell.mask
+                            updated = True
+                if (self.observed or self.traced) and len(removed_list) > 0:
+                    possible_set = set(self.geometry.mask_values[possible_mask])
+                    self.emit("naked_subset", unit=unit_key, cells=selected, values=possible_set, eliminations=removed_list)
+                if self.observed and len(removed_list) > 0:
+                    self.print("Naked subset: possible union set of %s is %s" % (str(selected), str(possible_set)))
+                    for (cell_key, removing) in removed_list:
+                        self.print("\tRemoving from others(%s)" % (str(cell_key)))
+                    self.wait_for_next_setep(used_group=unit_key, interest_cells=selected, interest_name="Naked({})".format(select_count), interest_values=possible_set)
+        return updated
+
+    # select_count 개의 숫자가 들어갈 수 있는 자리가 합쳐서 select_count 개면 그 자리에서 다른 후보를 지운다
+    def solve_hidden_subset(self, unit_key, masks, all_possibles, select_count, seen):
+        stats = self.stats
+        updated = False
+        mask_values = self.geometry.mask_values
+        unit_cells = self.geometry.unit_cells
+        # 숫자 -> 그 숫자가 들어갈 수 있는 unit 안의 위치 mask
+        positions = dict.fromkeys(mask_values[all_possibles], 0)
+        for position, cell_key in enumerate(unit_cells[unit_key]):
+            if cell_key in masks:
+                for value in mask_values[masks[cell_key]]:
+                    positions[value] |= 1 << position
+        seen_key = (unit_key, "hidden", select_count)
+        last = seen.get(seen_key, {})
+        seen[seen_key] = dict(positions)
+        changed = set(value for value in positions if last.get(value) != positions[value])
+        if stats is not None:
+            stats.counts[(self.technique, "combinations")] += comb(len(positions), select_count)
+        for selected in subset_combinations(mask_values[all_possibles], positions, select_count, changed):
+            if stats is not None:
+                stats.counts[(self.technique, "checked")] += 1
+            position_mask = 0
+            for value in selected:
+                position_mask |= positions[value]
+            if popcount(position_mask) == select_count:
+                selected_mask = values_to_mask(selected)
+                removed_list = []
+                for position, cell_key in enumerate(unit_cells[unit_key]):
+                    if not position_mask & (1 << position):
+                        continue
+                    cell = self.get_cell(cell_key)
+                    removing = masks[cell_key] & ~selected_mask
+                    if cell.remove_mask(removing):
+                        masks[cell_key] = cell.mask
+                        for value in mask_values[removing]:
+                            positions[value] &= ~(1 << position)
+                        removed_list.append((cell_key, removing))
+                        updated = True
+                if (self.observed or self.traced) and len(removed_list) > 0:
+                    selected = set(selected)
+                    cell_with_selected = set(cell_key for (position, cell_key) in enumerate(unit_cells[unit_key]) if position_mask & (1 << position))
+                    self.emit("hidden_subset", unit=unit_key, cells=sorted(cell_with_selected), values=selected, eliminations=removed_list)
+                if self.observed and len(removed_list) > 0:
+                    self.print("Hidden subset: values %s exists only in %s" % (str(selected), str(cell_with_selected)))
+                    for (cell_key, removing) in removed_list:
+                        self.print("\tRemoving %s from %s" % (str(set(mask_values[removing])), str(cell_key)))
+                    self.wait_for_next_setep(used_group=unit_key, interest_cells=cell_with_selected, interest_name="Hidden({})".format(select_count), interest_values=selected)
+        return updated
     
-    def solve(self, recursion=True):
-        unit_updated = set()
+    # keys 중 mask 의 후보가 남은 cell 에서 mask 를 지우고 (cell key, 지운 mask) list 를 돌려준다
+    def remove_from_cells(self, keys, mask):
+        removed_list = []
+        unknown_cells = self.unknown_cells
+        for cell_key in keys:
+            if cell_key in unknown_cells:
+                cell = unknown_cells[cell_key]
+                removing = cell.mask & mask
+                if removing and cell.remove_mask(removing):
+                    removed_list.append((cell_key, removing))
+        return removed_list
 
-        while True:
-            unknown = self.take_unknown_keys()
-            updated_once = False
-            unit_updated = unit_updated.union(unknown)
-            if self.solve_unique(unknown):
-                updated_once = True
-                continue
-            all_units = set()
-            for updated_key in unknown:
-                for k in self.get_cell(updated_key).get_unit_keys():
-                    all_units.add(k)
-            if self.solve_unique_unit(all_units):
-                updated_once = True
+    # singles / subset 으로 더 할 것이 없을 때 Try 전에 돌리는 pattern 들. 싼 것부터 돌리고
+    # 하나라도 지우면 바로 돌아가서 singles / subset 부터 다시 한다
+    # 바깥 solve (recursion) 에서는 여기서 지우지 못했으면 Try 를 한 번 더 돌았을 것이므로
+    # 지운 technique 의 probe_rounds_saved 를 센다
+    def solve_patterns(self, recursion):
+        # fish 들이 같이 쓰는 line 별 위치 mask. 앞 stage 가 지웠으면 이미 돌아갔으므로 처음 만든 것을 계속 써도 된다
+        line_positions = dict()
+        stages = [
+            ("locked", self.solve_locked, ()),
+            (fish_names[2], self.solve_fish, (2, line_positions)),
+            ("xywing", self.solve_xywing, ()),
+            (fish_names[3], self.solve_fish, (3, line_positions)),
+            (fish_names[4], self.solve_fish, (4, line_positions)),
+        ]
+        for (technique, method, args) in stages:
+            if self.run_technique(technique, method, *args):
+                if recursion and self.stats is not None:
+                    self.stats.counts[(technique, "probe_rounds_saved")] += 1
+                return True
+        return False
+
+    # rect 와 line 이 겹치는 곳에만 있는 숫자
+    # rect 안에서 거기에만 있으면 line 의 나머지에서 (pointing), line 안에서 거기에만 있으면 rect 의 나머지에서 (claiming) 지운다
+    def solve_locked(self):
+        updated_once = False
+        unknown_cells = self.unknown_cells
+        mask_values = self.geometry.mask_values
+        for (rect_key, line_key, cells, rect_rest, line_rest) in self.geometry.intersections:
+            inside = 0
+            for cell_key in cells:
+                if cell_key in unknown_cells:
+                    inside |= unknown_cells[cell_key].mask
+            if inside == 0:
                 continue
-            if self.solve_subsection(all_units):
-                updated_once = True
+            rect_others = 0
+            for cell_key in rect_rest:
+                if cell_key in unknown_cells:
+                    rect_others |= unknown_cells[cell_key].mask
+            line_others = 0
+            for cell_key in line_rest:
+                if cell_key in unknown_cells:
+                    line_others |= unknown_cells[cell_key].mask
+            for (technique, locked, unit_key, rest) in (
+                ("pointing", inside & ~rect_others & line_others, rect_key, line_rest),
+                ("claiming", inside & ~line_others & rect_others, line_key, rect_rest),
+            ):
+                if locked == 0:
+                    continue
+                removed_list = self.remove_from_cells(rest, locked)
+                if removed_list:
+                    updated_once = True
+                    if self.observed or self.traced:
+                        values = set(mask_values[locked])
+                        locked_cells = [cell_key for cell_key in cells if cell_key in unknown_cells and unknown_cells[cell_key].mask & locked]
+                        self.emit(technique, unit=unit_key, cells=locked_cells, values=values, eliminations=removed_list)
+                    if self.observed:
+                        self.print("Locked candidates (%s): %s in %s only in %s" % (technique, str(values), self._get_unit_string(unit_key), str(locked_cells)))
+                        for (cell_key, removing) in removed_list:
+                            self.print("\tRemoving %s from %s" % (str(set(mask_values[removing])), str(cell_key)))
+                        self.wait_for_next_setep(used_group=unit_key, interest_cells=locked_cells, interest_name=technique.capitalize(), interest_values=values)
+        return updated_once
+
+    # (0: row / 1: col, 숫자) -> {line key: 그 line 에서 숫자가 들어갈 수 있는 위치 mask}
+    # row 의 위치는 col - 1, col 의 위치는 row - 1 번 bit
+    def get_line_positions(self):
+        geometry = self.geometry
+        mask_values = geometry.mask_values
+        ret = {(slot, value): dict() for slot in (0, 1) for value in geometry.values}
+        for (cell_key, cell) in self.unknown_cells.items():
+            (row, col) = cell_key
+            (row_key, col_key, _) = geometry.cell_units[cell_key]
+            for value in mask_values[cell.mask]:
+                rows = ret[(0, value)]
+                rows[row_key] = rows.get(row_key, 0) | (1 << (col - 1))
+                cols = ret[(1, value)]
+                cols[col_key] = cols.get(col_key, 0) | (1 << (row - 1))
+        return ret
+
+    # 크기 size 의 fish (2: X-Wing, 3: Swordfish, 4: Jellyfish)
+    # 한 숫자가 들어갈 수 있는 자리가 size 개의 row 에서 합쳐 size 개의 col 에만 있으면 그 col 의 다른 row 에서 지운다 (row / col 을 바꿔서도)
+    # line_positions 는 get_line_positions() 의 결과. 비어 있으면 채운다
+    def solve_fish(self, size, line_positions=None):
+        if line_positions is None:
+            line_positions = dict()
+        if not line_positions:
+            line_positions.update(self.get_line_positions())
+        updated_once = False
+        geometry = self.geometry
+        unknown_cells = self.unknown_cells
+        unit_cells = geometry.unit_cells
+        for value in geometry.values:
+            bit = value_to_bit(value)
+            for (base_keys, cover_keys, slot) in ((geometry.row_keys, geometry.col_keys, 0), (geometry.col_keys, geometry.row_keys, 1)):
+                positions = line_positions[(slot, value)]
+                lines = [line_key for line_key in base_keys if 2 <= popcount(positions.get(line_key, 0)) <= size]
+                if len(lines) < size:
+                    continue
+                for selected in subset_combinations(lines, positions, size, positions):
+                    cover = 0
+                    for line_key in selected:
+                        cover |= positions[line_key]
+                    if popcount(cover) != size:
+                        continue
+                    covers = [cover_keys[position] for position in range(geometry.size) if cover & (1 << position)]
+                    rest = [cell_key for cover_key in covers for cell_key in unit_cells[cover_key] if geometry.cell_units[cell_key][slot] not in selected]
+                    removed_list = self.remove_from_cells(rest, bit)
+                    if removed_list:
+                        updated_once = True
+                        if self.observed or self.traced:
+                            fish_cells = [cell_key for cover_key in covers for cell_key in unit_cells[cover_key] if geometry.cell_units[cell_key][slot] in selected and cell_key in unknown_cells and unknown_cells[cell_key].mask & bit]
+                            self.emit(fish_names[size], cells=fish_cells, values=[value], eliminations=removed_list)
+                        if self.observed:
+                            self.print("Fish(%d): %d in %s only in %s" % (size, value, ", ".join(self._get_unit_string(line_key) for line_key in selected), ", ".join(self._get_unit_string(cover_key) for cover_key in covers)))
+                            for (cell_key, removing) in removed_list:
+                                self.print("\tRemoving %d from %s" % (value, str(cell_key)))
+                            self.wait_for_next_setep(interest_cells=fish_cells, interest_name="Fish({})".format(size), interest_values=[value])
+        return updated_once
+
+    # 후보가 둘인 pivot {X, Y} 의 peer 중 {X, Z}, {Y, Z} 인 두 cell (pincer) 이 있으면
+    # pivot 이 X 든 Y 든 두 pincer 중 하나는 Z 이므로, 두 pincer 를 모두 보는 cell 에서 Z 를 지운다
+    def solve_xywing(self):
+        updated_once = False
+        geometry = self.geometry
+        unknown_cells = self.unknown_cells
+        for (pivot_key, pivot) in list(unknown_cells.items()):
+            pivot_mask = pivot.mask
+            if popcount(pivot_mask) != 2:
                 continue
-            if not updated_once and recursion:
-                before_sort = self.unknown_cells.items()
-                before_sort = sorted(before_sort, key=lambda x: len(x[1].possible))
-                sorted_keys = list(map(lambda x: x[0], before_sort))
-                for cell_key in sorted_keys: # self.unknown_cells.keys():
-                    fatal = []
-                    target_cell = self.get_cell(cell_key)
-                    possibles = target_cell.possible
-                    # if len(possibles) != 2:
-                    #     continue
-                    clones = []
-                    for possible in possibles:
-                        clone = self.copy()
-                        clone.set_print(False)
-                        try:
-                            clone.set_cell(cell_key, possible)
-                            clone.solve(recursion=False)
-                        except Exception as e:
-                            fatal.append((cell_key, possible, str(e)))
-                            continue
-                        clones.append(clone)
-                    new_impossibles = []
-                    for check_key in self.unknown_cells.keys():
-                        if check_key == cell_key:
-                            continue
-                        intersect = None
-                        for clone in clones:
-                            cell = clone.get_cell(check_key)
-                            this_intersect = cell.impossible.difference(self.get_cell(cell_key).impossible)
-                            if intersect is None:
-                                intersect = this_intersect
-                            else:
-                                intersect = intersect.intersection(this_intersect)
-                        if intersect is not None and len(intersect) > 0:
-                            new_impossibles.append((check_key, intersect))
-                    if len(new_impossibles) > 0 or len(fatal) > 0:
-                        self.print("For any possible value from", cell_key, possibles)
-                        remaining_possibles = set(possibles)
-                        for (cell_key, val, msg) in fatal:
-                            self.print("\tAssuming %s as %d causes %s" % (str(cell_key), val, msg))
-                            remaining_possibles.remove(val)
-                        if len(remaining_possibles) == 1:
-                            uniq_possible = remaining_possibles.pop()
-                            self.print("\t{} is the unique possibility among {}".format(uniq_possible, possibles))
-                            self.set_cell(cell_key, uniq_possible)
-                            updated_once = True
-                        else:
-                            for check_key, intersect in new_impossibles:
-                                cell = self.get_cell(check_key)
-                                self.print("\tImpossible", check_key, intersect)
-                                if cell.remove_possible(intersect):
-                                    updated_once = True
-                    if updated_once:
-                        self.wait_for_next_setep(interest_cells=[cell_key], interest_values=possibles, interest_name="Try")
+            pincers = []
+            for cell_key in geometry.cell_peers[pivot_key]:
+                if cell_key in unknown_cells:
+                    mask = unknown_cells[cell_key].mask
+                    if popcount(mask) == 2 and popcount(mask & pivot_mask) == 1:
+                        pincers.append((cell_key, mask))
+            for index, (first_key, first_mask) in enumerate(pincers):
+                z = first_mask & ~pivot_mask
+                for (second_key, second_mask) in pincers[index+1:]:
+                    if second_mask & ~pivot_mask != z or second_mask == first_mask:
+                        continue
+                    second_peers = geometry.peer_sets[second_key]
+                    rest = [cell_key for cell_key in geometry.cell_peers[first_key] if cell_key in second_peers and cell_key != pivot_key]
+                    removed_list = self.remove_from_cells(rest, z)
+                    if removed_list:
+                        updated_once = True
+                        if self.observed or self.traced:
+                            values = set(geometry.mask_values[pivot_mask | z])
+                            wing_cells = [pivot_key, first_key, second_key]
+                            self.emit("xywing", cells=wing_cells, values=values, eliminations=removed_list)
+                        if self.observed:
+                            self.print("XY-Wing: pivot %s with %s and %s" % (str(pivot_key), str(first_key), str(second_key)))
+                            for (cell_key, removing) in removed_list:
+                                self.print("\tRemoving %s from %s" % (str(set(geometry.mask_values[removing])), str(cell_key)))
+                            self.wait_for_next_setep(interest_cells=wing_cells, interest_name="XY-Wing", interest_values=values)
+        return updated_once
+
+    # budget (SolveBudget) 을 주면 한도에 걸렸을 때 그 자리에서 멈추고 False 를 돌려준다
+    # 그때까지 줄인 후보는 판에 그대로 남아 있으므로 더 큰 budget 으로 solve() 를 다시 부르면 이어서 푼다
+    def solve(self, recursion=True, budget=None):
+        if budget is not None:
+            saved = self.budget
+            self.budget = budget
+            try:
+                self.solve(recursion)
+            except BudgetExceeded as e:
+                budget.exhausted = str(e)
+                return False
+            finally:
+                self.budget = saved
+            return True
+        if self.checkpoints and not recursion:
+            return self.solve_steps(recursion)
+        # probe 밖의 solve 는 (예외로 끝나도) 다음 solve() 가 이어갈 상태를 남기지 않는다.
+        # 한도에 걸려 멈춘 solve(recursion=True) 만 Scheduler 와 Try 위치를 남긴다
+        # (recursion 없이 바꾼 cell 은 take_changed 가 소비하므로 남겨 둔 Scheduler 는 알 수 없다)
+        resumable = False
+        try:
+            return self.solve_steps(recursion)
+        except BudgetExceeded:
+            resumable = recursion
+            raise
+        finally:
+            self.probe_seen = None
+            if not resumable:
+                self.scheduler = None
+                self.try_position = 0
+
+    def solve_steps(self, recursion):
+        # probe 안에서는 pattern 을 돌리지 않는다 (probe 마다 판 전체를 훑으면 probe 가 두 배 넘게 느려진다)
+        use_patterns = self.patterns and (recursion or self.probe_seen is None)
+        if recursion and self.scheduler is not None:
+            # 한도에 걸려 멈췄던 (또는 snapshot 에서 되살린) 작업 목록에서 이어간다. 그 뒤 바뀐 cell 은 add_changed 가 넣는다
+            scheduler = self.scheduler
+        elif recursion or self.probe_seen is None:
+            scheduler = Scheduler(self.unknown_cells.keys(), self.geometry)
+            self.take_changed()
+        else:
+            # solve_try 의 probe 안: 바깥은 모든 technique 가 더 할 일이 없는 fixpoint 이므로
+            # probe 가 바꾼 cell (self.changed) 과 그 unit 만 보면 된다
+            scheduler = Scheduler((), self.geometry, (), self.probe_seen)
+        if recursion:
+            self.scheduler = scheduler
+
+        while True:
+            if self.budget is not None:
+                self.budget.check(self.trail is not None)
+            updated_once = False
+            changed = self.take_changed()
+            if changed and recursion:
+                # 멈춘 뒤 판이 바뀌었으면 Try 는 처음 cell 부터 다시 본다
+                self.try_position = 0
+            scheduler.add_changed(changed, self.unknown_cells)
+            if scheduler.cells:
+                if self.run_technique("unique", self.solve_unique, scheduler.take_cells(self.unknown_cells)):
+                    updated_once = True
+                    continue
+            if scheduler.unique_units:
+                if self.run_technique("unique_unit", self.solve_unique_unit, scheduler.take_units(scheduler.unique_units)):
+                    updated_once = True
+                    continue
+            if scheduler.subsection_units:
+                units = scheduler.take_units(scheduler.subsection_units)
+                for index, unit_key in enumerate(units):
+                    if self.run_technique("subsection", self.solve_subsection, [unit_key], scheduler.subset_seen):
+                        # 아직 보지 못한 unit 은 다음 pass 로 넘긴다
+                        scheduler.subsection_units.update(units[index+1:])
+                        updated_once = True
                         break
+                if updated_once:
+                    continue
+            if scheduler.patterns and use_patterns:
+                scheduler.patterns = False
+                if self.solve_patterns(recursion):
+                    updated_once = True
+                    continue
+            if not updated_once and recursion:
+                # 여기는 모든 unit 을 훑은 fixpoint 이고 probe 는 매번 이 상태에서 시작하므로
+                # probe 안의 solve 는 probe 가 바꾼 곳과 그 subset 조합만 보면 된다 (16x16 이상에서 큰 차이)
+                self.probe_seen = scheduler.subset_seen
+                try:
+                    if self.run_technique("try", self.solve_try):
+                        updated_once = True
+                finally:
+                    self.probe_seen = None
             if not updated_once:
                 break
-    
+        if recursion:
+            self.scheduler = None
+        return True
+
+    # 모든 unknown cell 을 후보가 적은 순으로, 후보마다 가정해 보고(probe) 결과를 모은다
+    # probe_depth 가 2 이상이면 각 probe 가 그 안에서 한 단계씩 더 가정해 보고, 그때 배운 nogood 을 먼저 적용한다
+    # probe_pool 로 한 번에 보낸 probe 들은 서로가 배운 nogood 을 모르므로 (한 process 에서는 뒤의 probe 가 바로 쓴다)
+    # 아무것도 못 지웠는데 새 nogood 이 생겼으면 그것을 넘겨서 다시 돈다 (nogood 은 더 강해지기만 하므로 언젠가 멈춘다)
+    def solve_try(self):
+        relearn = False
+        while True:
+            known_nogoods = set(self.nogood_list)
+            if self.solve_try_once(relearn):
+                return True
+            if self.probe_pool is None or set(self.nogood_list) == known_nogoods:
+                return False
+            relearn = True
+
+    # solve_try 의 한 바퀴. relearn 은 parallel_probes 참고
+    def solve_try_once(self, relearn=False):
+        if self.nogood_list and self.apply_nogoods():
+            return True
+        updated_once = False
+        before_sort = self.unknown_cells.items()
+        before_sort = sorted(before_sort, key=lambda x: x[1].count())
+        sorted_keys = list(map(lambda x: x[0], before_sort))
+        # 한도에 걸려 멈췄던 Try 는 같은 상태에서 다시 부르므로 (정렬 순서도 같다) 아무것도 못 지운 앞의 cell 은 건너뛴다
+        start = self.try_position
+        sorted_keys = sorted_keys[start:]
+        # probe_pool 이 있으면 앞의 cell 몇 개의 probe 를 미리 한꺼번에 보내 두고, 결과는 아래에서 순서대로 꺼낸다
+        parallel = None
+        if self.probe_pool is not None:
+            parallel = self.parallel_probes(sorted_keys, relearn)
+        for (position, cell_key) in enumerate(sorted_keys, start): # self.unknown_cells.keys():
+            self.try_position = position
+            fatal = []
+            target_cell = self.get_cell(cell_key)
+            possibles = set(target_cell.possible)
+            # if len(possibles) != 2:
+            #     continue
+            check_keys = [check_key for check_key in self.unknown_cells.keys() if check_key != cell_key]
+            outcomes = []
+            if parallel is not None:
+                all_mask = self.geometry.all_values_mask
+                for (possible, after, message) in next(parallel):
+                    if after is None:
+                        fatal.append((cell_key, possible, message))
+                    else:
+                        outcomes.append({check_key: all_mask & ~after[self.geometry.cell_index(check_key)] for check_key in check_keys})
+            else:
+                for possible in possibles:
+                    try:
+                        outcomes.append(self.run_technique("probe", self.probe, cell_key, possible, check_keys, self.probe_depth))
+                    except BudgetExceeded:
+                        raise
+                    except Exception as e:
+                        fatal.append((cell_key, possible, str(e)))
+                        continue
+            new_impossibles = []
+            base_impossible = self.geometry.all_values_mask & ~target_cell.mask
+            for check_key in check_keys:
+                intersect = None
+                for outcome in outcomes:
+                    this_intersect = outcome[check_key] & ~base_impossible
+                    if intersect is None:
+                        intersect = this_intersect
+                    else:
+                        intersect = intersect & this_intersect
+                if intersect is not None and intersect != 0:
+                    new_impossibles.append((check_key, intersect))
+            if len(new_impossibles) > 0 or len(fatal) > 0:
+                if self.observed:
+                    self.print("For any possible value from", cell_key, possibles)
+                remaining_possibles = set(possibles)
+                for (cell_key, val, msg) in fatal:
+                    if self.observed:
+                        self.print("\tAssuming %s as %d causes %s" % (str(cell_key), val, msg))
+                    remaining_possibles.remove(val)
+                if len(remaining_possibles) == 1:
+                    uniq_possible = remaining_possibles.pop()
+                    if self.traced:
+                        self.emit("try", cells=[cell_key], values=[uniq_possible], eliminations=[(cell_key, values_to_mask(possibles) & ~value_to_bit(uniq_possible))])
+                    if self.observed:
+                        self.print("\t{} is the unique possibility among {}".format(uniq_possible, possibles))
+                    self.set_cell(cell_key, uniq_possible)
+                    updated_once = True
+                else:
+                    removed_list = []
+                    for check_key, intersect in new_impossibles:
+                        cell = self.get_cell(check_key)
+                        if self.observed:
+                            self.print("\tImpossible", check_key, set(self.geometry.mask_values[intersect]))
+                        removing = cell.mask & intersect
+                        if cell.remove_mask(intersect):
+                            updated_once = True
+                            if self.traced:
+                                removed_list.append((check_key, removing))
+                    if self.traced and len(removed_list) > 0:
+                        self.emit("try", cells=[cell_key], values=possibles, eliminations=removed_list)
+            if updated_once:
+                if self.observed:
+                    self.wait_for_next_setep(interest_cells=[cell_key], interest_values=possibles, interest_name="Try")
+                break
+        self.try_position = 0
+        if parallel is not None:
+            parallel.close()
+        return updated_once
+
+    # sorted_keys 순서로 cell 마다 [(value, probe 후 후보 상태 또는 None, 실패 메시지)] 를 내준다 (value 는 set(possible) 순서)
+    # 앞으로 볼 probe_window 개 cell 의 probe 를 probe_pool 에 미리 보내 두고, 결과는 MRV 순서대로 기다려서 합친다
+    # worker 는 매번 같은 상태의 판에서 probe 하고, 보낼 때까지 배운 nogood 과 바깥 solve 의 subset seen (probe_seen) 을 같이 받는다
+    # nogood 에 걸리는지는 결과를 MRV 순서로 꺼낼 때 다시 보므로, 어떤 probe 를 버리는지는 worker 수와 상관없다
+    # (2 단계 이상이면 worker 가 보낸 뒤에 배운 nogood 은 모르므로 probe 결과가 한 process 때보다 약할 수는 있다)
+    # relearn 이면 (새 nogood 으로 다시 돌 때) 성공한 probe 의 memo 는 쓰지 않는다
+    # 다 쓰지 않고 close() 하면 아직 시작하지 않은 probe 는 취소한다
+    def parallel_probes(self, sorted_keys, relearn=False):
+        state = self.candidate_state()
+        seen = self.probe_seen
+        budget = self.budget
+        deadline = budget.deadline if budget is not None else None
+        collect_stats = self.stats is not None
+        depth = self.probe_depth
+        queue = []
+        next_index = 0
+        try:
+            while next_index < len(sorted_keys) or queue:
+                while next_index < len(sorted_keys) and len(queue) < self.probe_window:
+                    if budget is not None:
+                        budget.check()
+                    cell_key = sorted_keys[next_index]
+                    next_index += 1
+                    tasks = []
+                    for value in set(self.all_cells[cell_key].possible):
+                        memo_key = (cell_key, value) if depth == 1 else (cell_key, value, depth)
+                        # memo 로 끝나면 (probe 후 후보 상태, 메시지), nogood 에 걸리면 None, 아니면 worker 의 Future
+                        task = self.lookup_probe(memo_key, state)
+                        if task is not None and relearn and task[0] is not None:
+                            task = None
+                        if task is None and self.violated_nogood(cell_key, value) is None:
+                            task = self.probe_pool.submit(probe_task, self.engine, self.geometry.size, state, tuple(self.nogood_list), seen, cell_key, value, depth, self.deep_probe_limit - self.deep_probes, collect_stats, deadline)
+                        tasks.append((value, memo_key, task))
+                    queue.append((cell_key, tasks))
+                (cell_key, tasks) = queue.pop(0)
+                results = []
+                for (value, memo_key, task) in tasks:
+                    if isinstance(task, tuple):
+                        self.count_probe("memo_hits")
+                        results.append((value,) + task)
+                        continue
+                    # 보낸 뒤에 앞의 probe 가 배운 nogood 에 걸리면 한 process 에서처럼 결과를 버린다
+                    nogood = self.violated_nogood(cell_key, value)
+                    if nogood is not None:
+                        if task is not None:
+                            task.cancel()
+                        self.count_probe("nogood_prunes")
+                        results.append((value, None, "Nogood %s" % str(sorted(nogood))))
+                        continue
+                    (status, after, message, learned, stats, counts) = task.result()
+                    if collect_stats:
+                        self.stats.merge(stats)
+                    self.deep_probes += counts[2]
+                    if budget is not None:
+                        budget.probes += counts[0]
+                        budget.eliminated += counts[1]
+                    if status == "budget":
+                        raise BudgetExceeded(message)
+                    self.probe_memo[memo_key] = (state, after, message)
+                    for nogood in learned:
+                        self.add_nogood(nogood)
+                    results.append((value, after, message))
+                yield results
+        finally:
+            for (_, tasks) in queue:
+                for (_, _, task) in tasks:
+                    if isinstance(task, concurrent.futures.Future):
+                        task.cancel()
+
     def print_current(self):
-        for i in range(1, 10):
-            for j in range(1, 10):
+        size = self.geometry.size
+        for i in range(1, size+1):
+            for j in range(1, size+1):
                 if (i, j) in self.known_cells:
-                    self.print(self.known_cells[(i,j)].value,sep="", end=" ")
+                    self.print(value_text(self.known_cells[(i,j)].value),sep="", end=" ")
                 else:
                     self.print("-", sep="", end=" ")
             self.print()
         pass
 
+    # cell_keys 순서(0..80)의 숫자 list 를 받아 0 이 아닌 칸을 채운다
+    def set_grid(self, grid):
+        for key, value in zip(self.geometry.cell_keys, grid):
+            if value > 0:
+                self.set_cell(key, value)
+
+    # 현재 값들을 cell_keys 순서(0..80)의 숫자 list 로 (빈 칸은 0)
+    def get_grid(self):
+        return [self.all_cells[key].value for key in self.geometry.cell_keys]
+
+    # 논리 풀이/출력 없이 backtracking 으로 푼 해를 돌려준다. 해가 없으면 None
+    # board 자체는 바꾸지 않는다
+    def solve_fast(self):
+        return solve_fast(self.get_grid())
+
+    def count_solutions(self, limit=2):
+        return count_solutions(self.get_grid(), limit)
+
     def copy(self):
-        ret = Sudoku(init=False)
+        if self.stats is not None:
+            self.stats.counts[("copy", "calls")] += 1
+        ret = Sudoku(init=False, engine=self.engine, size=self.geometry.size)
         for key, cell in self.all_cells.items():
             ret.all_cells[key] = cell.copy(ret)
         for key, cell in self.known_cells.items():
             ret.known_cells[key] = ret.all_cells[key]
         for key, cell in self.unknown_cells.items():
             ret.unknown_cells[key] = ret.all_cells[key]
+        ret.unsolved_count = dict(self.unsolved_count)
         return ret
 
+    # 후보 상태와 풀이 진행 (Scheduler 의 작업 목록, Try 위치, 그 cell 에서 끝난 probe 결과, nogood) 을 bytes 로
+    # board_from_snapshot 으로 되살린다. Scheduler 의 subset seen 과 나머지 probe memo 는 넣지 않는다 (없어도 결과는 같다)
+    def snapshot(self):
+        geometry = self.geometry
+        if self.scheduler is None:
+            scheduler = Scheduler(self.unknown_cells.keys(), geometry)
+        else:
+            scheduler = Scheduler(self.scheduler.cells, geometry, ())
+            scheduler.unique_units.update(self.scheduler.unique_units)
+            scheduler.subsection_units.update(self.scheduler.subsection_units)
+            scheduler.patterns = self.scheduler.patterns
+        scheduler.add_changed(self.peek_changed(), self.unknown_cells)
+        current = self.candidate_state()
+        # 한도에 걸린 Try cell 에서 이미 끝난 probe. 없으면 되살린 판이 같은 probe 를 매번 다시 하다가 또 한도에 걸린다
+        outcomes = []
+        ordered = sorted(self.unknown_cells.items(), key=lambda x: x[1].count())
+        if self.try_position < len(ordered):
+            (cell_key, cell) = ordered[self.try_position]
+            for value in geometry.mask_values[cell.mask]:
+                for depth in sorted(set([1, self.probe_depth])):
+                    memo = self.lookup_probe((cell_key, value) if depth == 1 else (cell_key, value, depth), current)
+                    if memo is not None:
+                        outcomes.append((geometry.cell_index(cell_key), value, depth, memo[0]))
+        width = (geometry.size + 7) // 8
+        parts = [
+            snapshot_header.pack(snapshot_magic, snapshot_version, geometry.size, 1 if scheduler.patterns else 0, self.try_position, len(self.nogood_list), len(outcomes)),
+            b"".join(mask.to_bytes(width, "little") for mask in current),
+            pack_bits(self.all_cells[key].value != 0 for key in geometry.cell_keys),
+            pack_bits(key in scheduler.cells for key in geometry.cell_keys),
+            pack_bits(key in scheduler.unique_units for key in geometry.unit_keys),
+            pack_bits(key in scheduler.subsection_units for key in geometry.unit_keys),
+        ]
+        for nogood in self.nogood_list:
+            parts.append(bytes([len(nogood)]))
+            parts.extend(snapshot_literal.pack(geometry.cell_index(key), value) for (key, value) in sorted(nogood))
+        for (index, value, depth, after) in outcomes:
+            parts.append(snapshot_outcome.pack(index, value, depth, 0 if after is None else 1))
+            if after is not None:
+                parts.append(b"".join(mask.to_bytes(width, "little") for mask in after))
+        return b"".join(parts)
+
+
+# ASCII 숫자 -> 숫자 값
+digit_values = bytes.maketrans(b"0123456789", bytes(range(10)))
+
+# 9 보다 큰 판에서 숫자 하나를 한 글자로: 10 부터는 A, B, ... (16x16 은 1..9 A..G, 25x25 는 1..9 A..P)
+value_chars = "0123456789ABCDEFGHIJKLMNOP"
+char_values = dict((char, value) for (value, char) in enumerate(value_chars))
+char_values.update((char.lower(), value) for (char, value) in list(char_values.items()) if char.isalpha())
+char_values["."] = 0
+
+def value_text(value):
+    return value_chars[value]
+
+# main() 과 같이 숫자 이외의 문자는 무시하고 81 개의 숫자를 읽는다
+# size 가 9 보다 크면 size*size 개의 글자를 value_chars 로 읽는다 (빈 칸은 0 이나 .)
+def parse_puzzle(text, size=9):
+    if size != 9:
+        limit = size + 1
+        grid = [char_values[x] for x in text if x in char_values and char_values[x] < limit]
+        if len(grid) != size * size:
+            raise Exception("Puzzle must have %d cells, got %d" % (size * size, len(grid)))
+        return grid
+    if len(text) == 81 and text.isascii() and text.isdigit():
+        return list(text.encode().translate(digit_values))
+    grid = [int(x) for x in text if x in "0123456789"]
+    if len(grid) != 81:
+        raise Exception("Puzzle must have 81 digits, got %d" % len(grid))
+    return grid
+
+def format_grid(grid):
+    if len(grid) > 81:
+        return "".join([value_chars[value] for value in grid])
+    return "".join(map(str, grid))
+
+# 주어진 숫자끼리 같은 unit 에서 겹치지 않는지
+def is_valid_grid(grid):
+    for indices in grid_geometry(grid).unit_indices:
+        seen = 0
+        for index in indices:
+            if grid[index]:
+                bit = 1 << (grid[index] - 1)
+                if seen & bit:
+                    return False
+                seen |= bit
+    return True
+
+# Knuth 의 Algorithm X (exact cover). dancing links 대신 column -> row set dict 로 구현
+# row (index, value) 는 cell / row-숫자 / col-숫자 / rect-숫자 의 4 개 column 을 덮는다 (Geometry.exact_cover)
+(exact_cover_rows, exact_cover_columns) = standard.exact_cover()
+
+def _cover(columns, row_key, rows=exact_cover_rows):
+    removed = []
+    for column in rows[row_key]:
+        for other in columns[column]:
+            for other_column in rows[other]:
+                if other_column != column:
+                    columns[other_column].remove(other)
+        removed.append(columns.pop(column))
+    return removed
+
+def _uncover(columns, row_key, removed, rows=exact_cover_rows):
+    for column in reversed(rows[row_key]):
+        columns[column] = removed.pop()
+        for other in columns[column]:
+            for other_column in rows[other]:
+                if other_column != column:
+                    columns[other_column].add(other)
+
+# 해를 최대 limit 개까지 찾아 81 개 숫자 list 들로 돌려준다
+# exclude 의 (index, value) 는 놓을 수 없는 숫자로 보고, rng (random.Random) 를 주면 숫자를 무작위 순서로 놓아 본다
+# grid 의 길이로 판 크기를 정한다 (Geometry)
+def search_solutions(grid, limit=1, exclude=(), rng=None):
+    geometry = grid_geometry(grid)
+    (rows, all_columns) = geometry.exact_cover()
+    columns = {column: set(row_keys) for column, row_keys in all_columns.items()}
+    for row_key in exclude:
+        for column in rows[row_key]:
+            columns[column].discard(row_key)
+    values = list(grid)
+    for index, value in enumerate(values):
+        if value == 0:
+            continue
+        row_key = (index, value)
+        for column in rows[row_key]:
+            if column not in columns:
+                # 주어진 숫자끼리 충돌
+                return []
+        _cover(columns, row_key, rows)
+    solutions = []
+
+    def search():
+        if not columns:
+            solutions.append(list(values))
+            return len(solutions) >= limit
+        # 가능한 row 가 가장 적은 column (naked / hidden single 이 먼저 잡힌다)
+        column = None
+        best_count = geometry.size + 1
+        for candidate, row_keys in columns.items():
+            count = len(row_keys)
+            if count < best_count:
+                column, best_count = candidate, count
+                if count <= 1:
+                    break
+        row_keys = list(columns[column])
+        if rng is not None:
+            rng.shuffle(row_keys)
+        for row_key in row_keys:
+            removed = _cover(columns, row_key, rows)
+            values[row_key[0]] = row_key[1]
+            found = search()
+            _uncover(columns, row_key, removed, rows)
+            if found:
+                return True
+        return False
+
+    search()
+    return solutions
+
+# 해가 있으면 숫자 list, 없으면 None
+def solve_fast(grid):
+    if isinstance(grid, str):
+        grid = parse_puzzle(grid)
+    solutions = search_solutions(grid, 1)
+    if len(solutions) == 0:
+        return None
+    return solutions[0]
+
+# 해의 개수를 limit 까지만 센다 (기본값 2 면 0: 해 없음, 1: 유일, 2: 여러 개)
+def count_solutions(grid, limit=2):
+    if isinstance(grid, str):
+        grid = parse_puzzle(grid)
+    return len(search_solutions(grid, limit))
+
+
+# 풀이가 같은 모양으로 유지되는 변환: (transpose 후) row / col 순서를 바꾸고 숫자를 digits 로 바꾼다
+# rows / cols 는 같은 band / stack 안에서만, band / stack 끼리만 섞인 0..8 순열이어야 한다
+# digits[v] 는 v 가 바뀔 숫자 (digits[0] == 0)
+def transform_grid(grid, digits, rows, cols, transpose=False):
+    if transpose:
+        grid = [grid[col * 9 + row] for row in range(9) for col in range(9)]
+    return [digits[grid[rows[row] * 9 + cols[col]]] for row in range(9) for col in range(9)]
+
+def random_line_order(rng):
+    bands = rng.sample(range(3), 3)
+    return [band * 3 + line for band in bands for line in rng.sample(range(3), 3)]
+
+# rng 는 random.Random. 무작위로 변환한 grid 를 돌려준다
+def random_transform(grid, rng):
+    digits = [0] + rng.sample(range(1, 10), 9)
+    return transform_grid(grid, digits, random_line_order(rng), random_line_order(rng), rng.random() < 0.5)
+
+# transform_grid 의 역변환. transform_grid 로 바꾼 grid 를 원래 모양으로 되돌린다
+def inverse_transform_grid(grid, digits, rows, cols, transpose=False):
+    inverse_digits = [0] * 10
+    for (value, digit) in enumerate(digits):
+        inverse_digits[digit] = value
+    ret = [0] * 81
+    for row in range(9):
+        for col in range(9):
+            ret[rows[row] * 9 + cols[col]] = inverse_digits[grid[row * 9 + col]]
+    if transpose:
+        ret = [ret[col * 9 + row] for row in range(9) for col in range(9)]
+    return ret
+
+# 각 줄의 signature 를 정한다. 처음에는 주어진 숫자 개수이고, 매 round 마다
+# 그 줄의 숫자가 있는 반대 방향 줄들의 signature 를 더해 다듬는다. 숫자 바꾸기 / 줄 섞기에 대해 불변이다
+def line_signatures(grid, rounds=2):
+    rows = [[col for col in range(9) if grid[row * 9 + col]] for row in range(9)]
+    cols = [[row for row in range(9) if grid[row * 9 + col]] for col in range(9)]
+    row_sig = [len(x) for x in rows]
+    col_sig = [len(x) for x in cols]
+    for _ in range(rounds):
+        new_row = [(row_sig[row], tuple(sorted(col_sig[col] for col in rows[row]))) for row in range(9)]
+        new_col = [(col_sig[col], tuple(sorted(row_sig[row] for row in cols[col]))) for col in range(9)]
+        row_ranks = {sig: rank for (rank, sig) in enumerate(sorted(set(new_row)))}
+        col_ranks = {sig: rank for (rank, sig) in enumerate(sorted(set(new_col)))}
+        row_sig = [row_ranks[sig] for sig in new_row]
+        col_sig = [col_ranks[sig] for sig in new_col]
+    return (row_sig, col_sig)
+
+# 같은 값끼리의 순서는 모두 돌려보도록 items 를 key 순으로 정렬한 순서들을 내준다
+def tied_orders(items, key):
+    groups = [list(group) for (_, group) in itertools.groupby(sorted(items, key=key), key=key)]
+    for choice in itertools.product(*[itertools.permutations(group) for group in groups]):
+        yield [item for group in choice for item in group]
+
+# signature 순으로 band 를 놓고 각 band 안에서 다시 signature 순으로 줄을 놓는 0..8 순열들
+def line_orders(sig):
+    band_key = lambda band: sorted(sig[band * 3 + line] for line in range(3))
+    for bands in tied_orders(range(3), band_key):
+        per_band = [tied_orders([band * 3 + line for line in range(3)], lambda line: sig[line]) for band in bands]
+        for lines in itertools.product(*[list(x) for x in per_band]):
+            yield [line for band_lines in lines for line in band_lines]
+
+# 숫자를 처음 나온 순서대로 1, 2, ... 로 바꾸는 digits
+def first_seen_digits(grid):
+    digits = [0] * 10
+    next_digit = 1
+    for value in grid:
+        if value and digits[value] == 0:
+            digits[value] = next_digit
+            next_digit += 1
+    for value in range(1, 10):
+        if digits[value] == 0:
+            digits[value] = next_digit
+            next_digit += 1
+    return digits
+
+# 숫자 바꾸기, band / stack, 그 안의 row / col 섞기, transpose 로 같아지는 퍼즐들이 같은 대표형을 갖도록 한다
+# (대표 grid, (digits, rows, cols, transpose)) 를 돌려준다. 대표 grid == transform_grid(grid, ...)
+# signature 가 같은 줄이 많으면 방향마다 limit 개의 (rows, cols) 조합만 보므로 그때는 같은 퍼즐도 다른 대표형이 나올 수 있다
+# 대표형과 변환은 항상 서로 맞으므로 cache 결과가 틀리지는 않는다
+def canonical_form(grid, limit=256):
+    best = None
+    for transpose in (False, True):
+        oriented = [grid[col * 9 + row] for row in range(9) for col in range(9)] if transpose else grid
+        (row_sig, col_sig) = line_signatures(oriented)
+        row_orders = list(itertools.islice(line_orders(row_sig), limit))
+        col_orders = list(itertools.islice(line_orders(col_sig), max(1, limit // len(row_orders))))
+        for rows in row_orders:
+            for cols in col_orders:
+                candidate = [oriented[row * 9 + col] for row in rows for col in cols]
+                digits = first_seen_digits(candidate)
+                candidate = [digits[value] for value in candidate]
+                if best is None or candidate < best[0]:
+                    best = (candidate, (digits, rows, cols, transpose))
+    return best
+
+# canonical_form 대표형 -> (대표형 기준 해 문자열, 상태) 를 들고 있는 LRU cache
+# 풀이 방식에 따라 상태가 다르므로 (fast 는 multiple 을, 논리 풀이는 partial 을 낸다) key 앞에 mode 를 붙인다
+# path 를 주면 만들 때 읽어 오고, save() 로 JSON lines 를 쓴다 (오래된 것부터)
+class SolutionCache:
+    def __init__(self, max_size=100000, path=None):
+        self.max_size = max_size
+        self.path = path
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            self.load(path)
+
+    def __len__(self):
+        return len(self.entries)
+
+    # probe_depth 가 다르면 논리 풀이가 어디까지 가는지도 다르므로 따로 둔다
+    @staticmethod
+    def key(grid, fast=False, probe_depth=1):
+        (canonical, transform) = canonical_form(grid)
+        if fast:
+            prefix = "fast:"
+        elif probe_depth == 1:
+            prefix = "logic:"
+        else:
+            prefix = "logic%d:" % probe_depth
+        return (prefix + format_grid(canonical), transform)
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key, solution, status):
+        self.entries[key] = (solution, status)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def load(self, path):
+        with open(path) as f:
+            for line in f:
+                if line.strip():
+                    (key, solution, status) = json.loads(line)
+                    self.put(key, solution, status)
+
+    def save(self, path=None):
+        path = self.path if path is None else path
+        temp = path + ".tmp"
+        with open(temp, "w") as f:
+            for key, (solution, status) in self.entries.items():
+                f.write(json.dumps([key, solution, status]) + "\n")
+        os.replace(temp, path)
+
+# 퍼즐 한 줄을 풀어서 (해 문자열, 상태) 를 돌려준다
+# 상태: solved, partial (논리 풀이가 끝까지 못 감), multiple, no_solution, invalid, budget (한도에 걸려 멈춤)
+# sink 를 주면 풀이 단계 event 를 trace_id 와 함께 보낸다 (fast 는 event 가 없다)
+# stats (SolveStats) 를 주면 technique 별 통계를 거기에 더한다
+# budget (SolveBudget) 에 걸리면 그때까지 채운 grid 와 "budget" 을 돌려준다
+# size 는 판 한 변의 칸 수 (parse_puzzle), probe_depth 는 Sudoku.set_probe_depth, probe_pool / probe_window 는 Sudoku.set_probe_pool
+# text 가 snapshot_text 문자열이면 그 판을 되살려서 멈췄던 곳부터 푼다 (판 크기는 snapshot 의 것)
+# snapshot 이면 한도에 걸렸을 때 grid 대신 snapshot_text 를 돌려준다 (그대로 다시 넘기면 이어서 푼다)
+def solve_puzzle(text, engine="set", fast=False, sink=None, trace_id=None, stats=None, budget=None, size=9, probe_depth=1, probe_pool=None, snapshot=False, probe_window=1):
+    resumed = None
+    try:
+        if text.startswith(snapshot_prefix):
+            resumed = board_from_snapshot(text, engine)
+            grid = resumed.get_grid()
+        else:
+            grid = parse_puzzle(text, size)
+    except Exception:
+        return ("-", "invalid")
+    if fast:
+        solutions = search_solutions(grid, 2)
+        if len(solutions) == 0:
+            return (format_grid(grid), "no_solution")
+        elif len(solutions) > 1:
+            return (format_grid(solutions[0]), "multiple")
+        return (format_grid(solutions[0]), "solved")
+    if resumed is None and not is_valid_grid(grid):
+        return (format_grid(grid), "no_solution")
+    sudoku = resumed if resumed is not None else Sudoku(engine=engine, gui=False, size=size)
+    sudoku.set_print(False)
+    sudoku.set_probe_depth(probe_depth)
+    if probe_pool is not None:
+        sudoku.set_probe_pool(probe_pool, probe_window)
+    if stats is not None:
+        sudoku.enable_stats(stats)
+    try:
+        if resumed is None:
+            sudoku.set_grid(grid)
+        if sink is not None:
+            sudoku.set_sink(sink, trace_id)
+        finished = sudoku.solve(recursion=True, budget=budget)
+    except Exception:
+        return (format_grid(sudoku.get_grid()), "no_solution")
+    grid = sudoku.get_grid()
+    if not finished:
+        if snapshot:
+            return (snapshot_text(sudoku.snapshot()), "budget")
+        return (format_grid(grid), "budget")
+    if 0 in grid:
+        return (format_grid(grid), "partial")
+    return (format_grid(grid), "solved")
+
+# collect_stats 면 퍼즐 하나의 SolveStats.as_dict() 를 네 번째 값으로 붙인다
+# time_limit (초) / max_probes / max_eliminations 는 퍼즐마다 새 SolveBudget 으로 건다
+def solve_timed(text, engine="set", fast=False, sink=None, trace_id=None, collect_stats=False, time_limit=None, max_probes=None, max_eliminations=None, size=9, probe_depth=1, probe_pool=None, snapshot=False, probe_window=1):
+    start = time.perf_counter()
+    stats = SolveStats() if collect_stats else None
+    budget = SolveBudget.from_limits(time_limit, max_probes, max_eliminations)
+    (solution, status) = solve_puzzle(text, engine, fast, sink, trace_id, stats, budget, size, probe_depth, probe_pool, snapshot, probe_window)
+    elapsed = time.perf_counter() - start
+    if collect_stats:
+        return (solution, status, elapsed, stats.as_dict())
+    return (solution, status, elapsed)
+
+# candidate_state() 로 받은 후보 상태 (cell_keys 순서의 mask) 로 판을 다시 만든다
+# placed (cell_keys 순서의 bool) 를 주면 그 칸만 놓고, 없으면 후보가 하나인 칸을 모두 놓는다
+def board_from_state(state, engine="mask", size=9, placed=None):
+    board = Sudoku(engine=engine, gui=False, size=size)
+    board.set_print(False)
+    if placed is None:
+        placed = [popcount(mask) == 1 for mask in state]
+    for (key, mask, fixed) in zip(board.geometry.cell_keys, state, placed):
+        if fixed:
+            board.set_cell(key, bit_to_value(mask))
+    for (key, mask) in zip(board.geometry.cell_keys, state):
+        cell = board.all_cells[key]
+        if cell.value == 0:
+            cell.remove_mask(cell.mask & ~mask)
+    board.take_changed()
+    return board
+
+# Sudoku.snapshot 형식: header (magic, version, 판 크기, flags, Try 위치, nogood 수, probe 결과 수) 뒤에
+#   cell 별 후보 mask ((판 크기 + 7) // 8 byte), 놓인 칸 / Scheduler 의 cell 목록 bitmap (cell_keys 순서),
+#   Scheduler 의 unique / subsection unit 목록 bitmap (unit_keys 순서), nogood 마다 literal 수 1 byte 와 (cell index, 값),
+#   Try cell 의 끝난 probe 마다 (cell index, 값, depth, 성공 여부) 와 성공이면 probe 후 후보 mask
+# flags 의 1 은 solve_patterns 를 아직 돌려야 한다는 뜻. 9x9 는 nogood / probe 결과 없이 204 byte
+snapshot_magic = b"SDKS"
+snapshot_version = 2
+snapshot_header = struct.Struct("<4sBBBHHB")
+snapshot_literal = struct.Struct("<HB")
+snapshot_outcome = struct.Struct("<HBBB")
+# 퍼즐 한 줄 대신 쓸 수 있는 snapshot 문자열의 머리 (뒤는 base64)
+snapshot_prefix = "snapshot:"
+
+# bool 들을 앞에서부터 낮은 bit 로 채운 bytes
+def pack_bits(flags):
+    flags = list(flags)
+    return sum(1 << index for (index, flag) in enumerate(flags) if flag).to_bytes((len(flags) + 7) // 8, "little")
+
+def unpack_bits(data, count):
+    bits = int.from_bytes(data, "little")
+    return [bool(bits >> index & 1) for index in range(count)]
+
+def snapshot_text(data):
+    return snapshot_prefix + base64.b64encode(data).decode()
+
+# Sudoku.snapshot() 의 bytes (또는 snapshot_text 문자열) 로 판을 되살린다
+# 되살린 판의 solve(recursion=True) 는 멈췄던 작업 목록과 Try 위치에서 이어간다
+def board_from_snapshot(data, engine="mask"):
+    if isinstance(data, str):
+        if not data.startswith(snapshot_prefix):
+            raise Exception("Not a solver snapshot")
+        data = base64.b64decode(data[len(snapshot_prefix):])
+    (magic, version, size, flags, try_position, nogood_count, outcome_count) = snapshot_header.unpack_from(data, 0)
+    if magic != snapshot_magic or version != snapshot_version:
+        raise Exception("Not a solver snapshot")
+    geometry = geometry_for(size)
+    cell_count = geometry.cell_count
+    unit_count = len(geometry.unit_keys)
+    width = (size + 7) // 8
+    offset = snapshot_header.size
+    state = [int.from_bytes(data[offset + index * width:offset + (index + 1) * width], "little") for index in range(cell_count)]
+    offset += cell_count * width
+    bitmaps = []
+    for count in (cell_count, cell_count, unit_count, unit_count):
+        length = (count + 7) // 8
+        bitmaps.append(unpack_bits(data[offset:offset + length], count))
+        offset += length
+    (placed, cells, unique_units, subsection_units) = bitmaps
+    board = board_from_state(state, engine, size, placed)
+    scheduler = Scheduler((), geometry, ())
+    scheduler.cells.update(key for (key, flag) in zip(geometry.cell_keys, cells) if flag)
+    scheduler.unique_units.update(key for (key, flag) in zip(geometry.unit_keys, unique_units) if flag)
+    scheduler.subsection_units.update(key for (key, flag) in zip(geometry.unit_keys, subsection_units) if flag)
+    scheduler.patterns = bool(flags & 1)
+    board.scheduler = scheduler
+    board.try_position = try_position
+    for _ in range(nogood_count):
+        length = data[offset]
+        offset += 1
+        literals = []
+        for _ in range(length):
+            (index, value) = snapshot_literal.unpack_from(data, offset)
+            offset += snapshot_literal.size
+            literals.append((geometry.cell_keys[index], value))
+        board.add_nogood(frozenset(literals))
+    current = board.candidate_state()
+    for _ in range(outcome_count):
+        (index, value, depth, ok) = snapshot_outcome.unpack_from(data, offset)
+        offset += snapshot_outcome.size
+        after = None
+        if ok:
+            after = tuple(int.from_bytes(data[offset + cell * width:offset + (cell + 1) * width], "little") for cell in range(cell_count))
+            offset += cell_count * width
+        cell_key = geometry.cell_keys[index]
+        message = None if ok else "Contradiction found before the snapshot"
+        board.probe_memo[(cell_key, value) if depth == 1 else (cell_key, value, depth)] = (current, after, message)
+    if offset != len(data):
+        raise Exception("Corrupt solver snapshot")
+    return board
+
+# thread 마다 마지막으로 만든 (engine, size, state) 와 그 판
+probe_boards = threading.local()
+
+# Sudoku.parallel_probes 의 worker 쪽: state 의 판에 nogoods 를 알려 주고 cell_key 에 value 를 depth 단계까지 가정해 본다
+# 같은 state 의 probe 가 이어서 오면 판을 다시 만들지 않는다 (probe 는 끝나면 항상 state 로 되돌아온다)
+# state 는 solve_try 가 부르는 fixpoint 이므로 probe 안의 solve 는 바뀐 곳만 본다 (probe_seen)
+# (ok / fail / budget, probe 후 후보 상태 또는 None, 실패 메시지, 새로 배운 nogood list, stats dict, (probe 수, 지운 후보 수, 깊은 probe 수)) 를 돌려준다
+def probe_task(engine, size, state, nogoods, seen, cell_key, value, depth, deep_limit, collect_stats, deadline):
+    cached = getattr(probe_boards, "board", None)
+    memo_key = (cell_key, value) if depth == 1 else (cell_key, value, depth)
+    if cached is not None and cached[0] == (engine, size, state):
+        # 앞의 probe 들이 남긴 (안쪽 단계의) memo 는 한 process 에서처럼 같이 쓴다. 이 probe 자체는 (relearn 일 수 있으므로) 다시 푼다
+        board = cached[1]
+        board.probe_memo.pop(memo_key, None)
+    else:
+        board = board_from_state(state, engine, size)
+        probe_boards.board = ((engine, size, state), board)
+    # 넘겨 받은 nogood 은 stats 에 세지 않는다
+    board.stats = None
+    board.nogoods.clear()
+    board.nogood_list = []
+    for nogood in nogoods:
+        board.add_nogood(nogood)
+    board.deep_probes = 0
+    board.deep_probe_limit = deep_limit
+    board.probe_seen = seen
+    board.stats = SolveStats() if collect_stats else None
+    board.budget = SolveBudget(deadline)
+    status = "ok"
+    after = None
+    message = None
+    try:
+        board.run_technique("probe", board.probe, cell_key, value, (), depth)
+        after = board.probe_memo[memo_key][1]
+    except BudgetExceeded as e:
+        status = "budget"
+        message = str(e)
+    except Exception as e:
+        status = "fail"
+        message = str(e)
+    stats = board.stats.as_dict() if collect_stats else None
+    known = set(nogoods)
+    learned = [nogood for nogood in board.nogood_list if nogood not in known]
+    return (status, after, message, learned, stats, (board.budget.probes, board.budget.eliminated, board.deep_probes))
+
+# Sudoku.set_probe_pool 에 줄 (pool, window). GIL 이 없는 (free-threaded) Python 이면 thread, 아니면 process 를 쓴다
+# window 는 만든 worker 수. core 가 하나뿐이거나 worker 가 하나면 나눠 돌려도 느려지기만 하므로 (None, 1) (한 process 에서 probe)
+def make_probe_pool(workers=None):
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1 or (os.cpu_count() or 1) == 1:
+        return (None, 1)
+    if not getattr(sys, "_is_gil_enabled", lambda: True)():
+        return (concurrent.futures.ThreadPoolExecutor(workers), workers)
+    return (concurrent.futures.ProcessPoolExecutor(workers), workers)
+
+# 퍼즐 문자열들을 process pool 로 나눠 풀고, 입력 순서대로 (해 문자열, 상태, 초) 를 내준다
+# worker 와는 문자열만 주고받는다 (Sudoku/Cell 은 pickle 하지 않는다)
+# 아직 결과를 꺼내지 않은 퍼즐은 workers * chunksize * 4 개까지만 pool 에 넘기므로 입력이 커도 메모리는 일정하다
+# (결과를 하나 꺼낼 때마다 하나 더 넘기므로 묶음 경계에서 가장 느린 chunk 를 기다리며 worker 가 놀지 않는다)
+# limits 는 solve_timed 의 time_limit / max_probes / max_eliminations / probe_depth / snapshot (probe_pool / probe_window 는 workers 가 1 일 때만)
+def solve_many(puzzles, workers=None, chunksize=64, engine="set", fast=False, collect_stats=False, limits=None, size=9):
+    worker = functools.partial(solve_timed, engine=engine, fast=fast, collect_stats=collect_stats, size=size, **(limits or {}))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for text in puzzles:
+            yield worker(text)
+        return
+    slots = threading.Semaphore(workers * chunksize * 4)
+    stopped = []
+    # pool 의 task thread 가 읽는다. 자리가 날 때까지 기다린다
+    def feed():
+        for text in puzzles:
+            slots.acquire()
+            if stopped:
+                return
+            yield text
+    with multiprocessing.Pool(workers) as pool:
+        try:
+            for result in pool.imap(worker, feed(), chunksize):
+                slots.release()
+                yield result
+        finally:
+            # 중간에 그만두면 기다리던 feed 를 깨워서 끝낸다 (그래야 pool 을 닫을 수 있다)
+            stopped.append(True)
+            slots.release()
+
+# solve_many 와 같지만 cache 에 있는 퍼즐 (같은 퍼즐의 변형 포함) 은 풀지 않는다
+# 입력을 window 개씩 읽어 cache 를 먼저 보고, 없는 것만 (window 안의 중복은 한 번만) solve_many 로 푼다
+# 한도에 걸린 (budget) 결과는 cache 에 넣지 않는다
+def solve_many_cached(puzzles, cache, workers=None, chunksize=64, engine="set", fast=False, collect_stats=False, limits=None):
+    extra = (dict(),) if collect_stats else ()
+    puzzles = iter(puzzles)
+    window = max(1, (workers or os.cpu_count() or 1) * chunksize * 4)
+    while True:
+        block = list(itertools.islice(puzzles, window))
+        if len(block) == 0:
+            break
+        results = [None] * len(block)
+        pending = dict()  # key -> [(row, transform, text)]
+        for (row, text) in enumerate(block):
+            start = time.perf_counter()
+            if text.startswith(snapshot_prefix):
+                # 되살린 판은 퍼즐 전체가 아니므로 cache 를 보지도, 넣지도 않는다
+                pending[(text, row)] = [(row, None, text)]
+                continue
+            try:
+                grid = parse_puzzle(text)
+            except Exception:
+                results[row] = ("-", "invalid", 0.0) + extra
+                continue
+            (key, transform) = SolutionCache.key(grid, fast, (limits or {}).get("probe_depth") or 1)
+            if key in pending:
+                cache.hits += 1
+                pending[key].append((row, transform, text))
+                continue
+            entry = cache.get(key)
+            if entry is None:
+                pending[key] = [(row, transform, text)]
+                continue
+            solution = format_grid(inverse_transform_grid(parse_puzzle(entry[0]), *transform))
+            results[row] = (solution, entry[1], time.perf_counter() - start) + extra
+        keys = list(pending.keys())
+        solved = solve_many([pending[key][0][2] for key in keys], workers, chunksize, engine, fast, collect_stats, limits)
+        for (key, result) in zip(keys, solved):
+            (solution, status) = result[:2]
+            (row, transform, text) = pending[key][0]
+            results[row] = result
+            if status == "invalid" or transform is None:
+                continue
+            if solution.startswith(snapshot_prefix):
+                # 한도에 걸려 snapshot 을 돌려받았으면 변형할 수 없으므로 같은 퍼즐의 변형들은 처음부터 다시 풀도록 퍼즐을 그대로 돌려준다
+                for (row, transform, text) in pending[key][1:]:
+                    results[row] = (format_grid(parse_puzzle(text)), status, 0.0) + extra
+                continue
+            canonical = format_grid(transform_grid(parse_puzzle(solution), *transform))
+            if status != "budget":
+                cache.put(key, canonical, status)
+            for (row, transform, text) in pending[key][1:]:
+                solution = format_grid(inverse_transform_grid(parse_puzzle(canonical), *transform))
+                results[row] = (solution, status, 0.0) + extra
+        for result in results:
+            yield result
+
+def read_puzzles(stream):
+    for line in stream:
+        line = line.strip()
+        if len(line) == 0 or line.startswith("#"):
+            continue
+        yield line
+
+# 묶음 파일 형식: 16 byte header (magic, version, kind, record 크기, record 수) 뒤에 고정 크기 record
+# 한 칸은 4 bit 이고 두 칸씩 한 byte 에 넣는다 (앞 칸이 위 4 bit). 81 칸은 41 byte
+# kind 가 solution 이면 record 끝에 상태 byte (packed_statuses 의 index) 가 하나 더 붙는다
+packed_magic = b"SDKB"
+packed_version = 1
+packed_header = struct.Struct("<4sBBHQ")
+packed_grid_size = 41
+packed_kinds = {"puzzle": (0, packed_grid_size), "solution": (1, packed_grid_size + 1)}
+packed_statuses = ["solved", "partial", "multiple", "no_solution", "invalid", "budget"]
+def pack_grid(grid):
+    grid = list(grid) + [0]
+    return bytes((grid[index] << 4) | grid[index + 1] for index in range(0, 82, 2))
+
+# record 의 앞 41 byte 를 81 자리 퍼즐 문자열로. 칸이 0..9 라서 hex 문자열이 곧 숫자 문자열이다
+def unpack_text(record):
+    return record[:packed_grid_size].hex()[:81]
+
+def unpack_grid(record):
+    return list(unpack_text(record).encode().translate(digit_values))
+
+# pipe / FIFO 는 읽은 byte 를 되돌릴 수 없으므로 일반 파일만 열어서 확인한다
+def is_packed_file(path):
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(packed_magic)) == packed_magic
+
+# --batch 입력을 (닫을 stream, 퍼즐 문자열 iterator) 로 연다
+# 일반 파일이 아니면 한 번만 열고, 같은 buffer 에서 magic 을 들여다본 뒤 그대로 text 로 읽는다
+def open_puzzles(path):
+    if path == "-":
+        return (sys.stdin, read_puzzles(sys.stdin))
+    if is_packed_file(path):
+        stream = PackedFile(path)
+        return (stream, stream.puzzles())
+    raw = open(path, "rb")
+    if not os.path.isfile(path) and raw.peek(len(packed_magic))[:len(packed_magic)] == packed_magic:
+        raw.close()
+        raise Exception("Packed puzzle files must be regular files (they are mmapped): %s" % path)
+    stream = io.TextIOWrapper(raw)
+    return (stream, read_puzzles(stream))
+
+# 묶음 파일을 mmap 해서 읽는다. record(i) 는 복사 없이 mmap 위의 memoryview 를 돌려준다
+class PackedFile:
+    def __init__(self, path):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, kind, self.record_size, self.count) = packed_header.unpack_from(self.map, 0)
+        if magic != packed_magic or version != packed_version:
+            self.close()
+            raise Exception("Not a packed puzzle file: %s" % path)
+        self.kind = {code: name for (name, (code, _)) in packed_kinds.items()}[kind]
+        if packed_header.size + self.count * self.record_size > len(self.map):
+            self.close()
+            raise Exception("Truncated packed puzzle file: %s" % path)
+        self.view = memoryview(self.map)[packed_header.size:packed_header.size + self.count * self.record_size]
+
+    def __len__(self):
+        return self.count
+
+    def record(self, index):
+        start = index * self.record_size
+        return self.view[start:start + self.record_size]
+
+    def grid(self, index):
+        return unpack_grid(self.record(index))
+
+    def status(self, index):
+        return packed_statuses[self.record(index)[packed_grid_size]]
+
+    # read_puzzles 처럼 퍼즐 문자열을 차례로 내준다
+    def puzzles(self):
+        for index in range(self.count):
+            yield unpack_text(self.record(index))
+
+    def close(self):
+        if getattr(self, "view", None) is not None:
+            self.view.release()
+            self.view = None
+        if not self.map.closed:
+            self.map.close()
+        self.file.close()
+
+# 묶음 파일 쓰기. record 수는 close() 에서 header 에 채운다
+class PackedWriter:
+    def __init__(self, path, kind="puzzle"):
+        (self.kind_code, self.record_size) = packed_kinds[kind]
+        self.kind = kind
+        self.file = open(path, "wb")
+        self.count = 0
+        self.write_header()
+
+    def write_header(self):
+        self.file.seek(0)
+        self.file.write(packed_header.pack(packed_magic, packed_version, self.kind_code, self.record_size, self.count))
+
+    # grid 는 숫자 list 나 81 자리 문자열. solution 이면 status 도 준다 ("-" 같은 빈 해는 0 으로 채운다)
+    def write(self, grid, status=None):
+        if isinstance(grid, str):
+            grid = [int(x) for x in grid] if len(grid) == 81 else [0] * 81
+        record = pack_grid(grid)
+        if self.kind == "solution":
+            record += bytes([packed_statuses.index(status)])
+        self.file.write(record)
+        self.count += 1
+
+    def close(self):
+        self.file.seek(0, os.SEEK_END)
+        self.write_header()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+# 한 줄에 퍼즐 하나인 text 파일을 묶음 파일로 바꾼다
+def pack_puzzles(text_path, packed_path):
+    with open(text_path) as stream, PackedWriter(packed_path) as writer:
+        for line in read_puzzles(stream):
+            writer.write(parse_puzzle(line))
+        return writer.count
+
+# 한 줄에 퍼즐 하나씩 읽어 "해 상태 ms" 를 한 줄씩 쓴다. tkinter 는 쓰지 않는다
+# trace 를 주면 풀이 단계를 JSON lines 로 기록한다 (이때는 한 process 에서 푼다)
+# numpy 면 numpy_chunk 개씩 sudoku_numpy 로 single 을 먼저 채우고 남은 판만 Sudoku.solve 로 푼다
+# cache (SolutionCache) 를 주면 이미 푼 퍼즐과 그 변형은 cache 에서 답한다
+# path 가 묶음 파일이면 mmap 으로 읽고, packed_out 을 주면 text 대신 solution 묶음 파일을 쓴다
+# limits 는 퍼즐마다 거는 solve_timed 의 time_limit / max_probes / max_eliminations / probe_depth / snapshot
+# size 가 9 가 아니면 text 입력만 받는다 (numpy / cache / 묶음 파일은 9x9 전용)
+def run_batch(path, engine="set", fast=False, out=sys.stdout, workers=1, chunksize=64, trace=None, stats=False, numpy=False, numpy_chunk=4096, cache=None, packed_out=None, limits=None, size=9):
+    if size != 9 and (numpy or cache is not None or packed_out is not None):
+        raise Exception("--numpy, --cache and --packed-out only support 9x9 puzzles")
+    (stream, puzzles) = open_puzzles(path)
+    writer = PackedWriter(packed_out, "solution") if packed_out is not None else None
+    sink = None
+    if trace is not None:
+        sink = JsonLinesSink(trace)
+        results = (solve_timed(line, engine, fast, sink, index, stats, size=size, **(limits or {})) for (index, line) in enumerate(puzzles))
+    elif cache is not None:
+        results = solve_many_cached(puzzles, cache, workers, chunksize, engine, fast, stats, limits)
+    elif numpy and not fast:
+        import sudoku_numpy
+        results = sudoku_numpy.solve_stream(puzzles, numpy_chunk, engine, workers, chunksize, stats, limits)
+    else:
+        results = solve_many(puzzles, workers, chunksize, engine, fast, stats, limits, size)
+    counts = defaultdict(int)
+    total_stats = SolveStats()
+    batch_start = time.perf_counter()
+    try:
+        for result in results:
+            (solution, status, elapsed) = result[:3]
+            if stats:
+                total_stats.merge(result[3])
+            counts[status] += 1
+            if writer is not None:
+                writer.write(solution, status)
+            else:
+                out.write("%s %s %.3f\n" % (solution, status, elapsed * 1000))
+    finally:
+        if stream is not sys.stdin:
+            stream.close()
+        if writer is not None:
+            writer.close()
+        if sink is not None:
+            sink.close()
+    elapsed = time.perf_counter() - batch_start
+    total = sum(counts.values())
+    summary = " ".join("%s=%d" % (status, count) for status, count in sorted(counts.items()))
+    print("%d puzzles in %.3fs %s" % (total, elapsed, summary), file=sys.stderr)
+    if cache is not None:
+        print("cache hits=%d misses=%d size=%d" % (cache.hits, cache.misses, len(cache)), file=sys.stderr)
+    if stats:
+        print(total_stats.report(), file=sys.stderr)
+    return counts
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sudoku solver")
+    parser.add_argument("--batch", metavar="FILE", help="solve one puzzle (81 digits, or --size squared cells) per line from FILE ('-' for stdin) without GUI")
+    parser.add_argument("--engine", choices=sorted(engines.keys()), help="candidate representation (default: set for 9x9, mask for larger boards)")
+    parser.add_argument("--size", type=int, default=9, help="board side length: 9, 16 or 25 (values above 9 are written A, B, ...)")
+    parser.add_argument("--fast", action="store_true", help="use the backtracking solver instead of the step-by-step one")
+    parser.add_argument("--workers", type=int, default=1, help="number of solver processes for --batch (0: one per core)")
+    parser.add_argument("--chunksize", type=int, default=64, help="puzzles sent to a worker at a time")
+    parser.add_argument("--stats", action="store_true", help="print per-technique counters and timings for the whole --batch")
+    parser.add_argument("--trace", metavar="FILE", help="write every deduction step of --batch as JSON lines (single process)")
+    parser.add_argument("--numpy", action="store_true", help="fill naked/hidden singles of many --batch puzzles at once with NumPy first")
+    parser.add_argument("--numpy-chunk", type=int, default=4096, help="puzzles propagated together with --numpy")
+    parser.add_argument("--cache", metavar="FILE", help="reuse --batch results of repeated or relabelled/permuted puzzles, kept in FILE between runs")
+    parser.add_argument("--cache-size", type=int, default=100000, help="most recently used puzzles kept by --cache")
+    parser.add_argument("--time-limit", type=float, help="stop each --batch puzzle after this many seconds and report it as 'budget'")
+    parser.add_argument("--max-probes", type=int, help="stop each --batch puzzle after this many Try probes")
+    parser.add_argument("--max-eliminations", type=int, help="stop each --batch puzzle after this many candidate eliminations")
+    parser.add_argument("--probe-depth", type=int, default=1, help="nested assumptions per Try probe; 2 or more also learns nogoods (all levels count toward --max-probes)")
+    parser.add_argument("--probe-workers", type=int, default=1, help="processes (threads on free-threaded Python) sharing the Try probes of one puzzle; needs --workers 1 (0: one per core)")
+    parser.add_argument("--snapshot", action="store_true", help="print puzzles stopped by a limit as a resumable solver snapshot instead of the partial grid; --batch continues such lines where they stopped")
+    parser.add_argument("--packed-out", metavar="FILE", help="write --batch solutions to FILE in the packed binary format instead of text")
+    parser.add_argument("--pack", nargs=2, metavar=("TEXT", "PACKED"), help="convert a one-puzzle-per-line TEXT file to the packed binary format (--batch reads either)")
+    args = parser.parse_args(argv)
+    if args.size >= len(value_chars):
+        parser.error("--size must be at most %d" % (len(value_chars) - 1))
+    try:
+        geometry_for(args.size)
+    except Exception as e:
+        parser.error(str(e))
+    if args.size != 9 and (args.numpy or args.cache is not None or args.packed_out is not None or args.pack is not None):
+        parser.error("--numpy, --cache, --packed-out and --pack only support --size 9")
+    if args.probe_workers != 1 and (args.workers != 1 or args.fast or args.numpy or args.cache is not None):
+        parser.error("--probe-workers needs --workers 1 without --fast, --numpy or --cache")
+    if args.snapshot and (args.fast or args.cache is not None or args.packed_out is not None):
+        parser.error("--snapshot cannot be used with --fast, --cache or --packed-out")
+    if args.engine is None:
+        args.engine = "set" if args.size == 9 else "mask"
+    return args
+
 
 def main():
 #     # Easy
@@ -627,17 +2783,46 @@ def main():
 # 060758319
 # """
 
-    sudoku = Sudoku()
+    args = parse_args()
+    if args.pack is not None:
+        count = pack_puzzles(args.pack[0], args.pack[1])
+        print("%d puzzles packed" % count, file=sys.stderr)
+        return
+    if args.batch is not None:
+        workers = args.workers if args.workers > 0 else None
+        cache = SolutionCache(args.cache_size, args.cache) if args.cache is not None else None
+        limits = {"time_limit": args.time_limit, "max_probes": args.max_probes, "max_eliminations": args.max_eliminations, "probe_depth": args.probe_depth, "snapshot": args.snapshot}
+        probe_pool = None
+        if args.probe_workers != 1:
+            (probe_pool, probe_window) = make_probe_pool(args.probe_workers if args.probe_workers > 0 else None)
+            if probe_pool is not None:
+                limits["probe_pool"] = probe_pool
+                limits["probe_window"] = probe_window
+        try:
+            run_batch(args.batch, args.engine, args.fast, workers=workers, chunksize=args.chunksize, trace=args.trace, stats=args.stats, numpy=args.numpy, numpy_chunk=args.numpy_chunk, cache=cache, packed_out=args.packed_out, limits=limits, size=args.size)
+        finally:
+            if probe_pool is not None:
+                probe_pool.shutdown()
+            # 중간에 멈추거나 (Ctrl-C) 실패해도 그때까지 푼 것은 남긴다
+            if cache is not None:
+                cache.save()
+        return
+
+    size = args.size
+    sudoku = Sudoku(engine=args.engine, size=size)
     sudoku.set_print(False)
+    sudoku.set_probe_depth(args.probe_depth)
+    if args.probe_workers != 1:
+        sudoku.set_probe_pool(*make_probe_pool(args.probe_workers if args.probe_workers > 0 else None))
     index = 0
-    while index < 9*9:
+    while index < size*size:
         text = input()
         for x in text:
-            if x not in "0123456789":
+            if x not in char_values or char_values[x] > size or (size == 9 and x == "."):
                 continue
-            col = index % 9 + 1
-            row = index // 9 + 1
-            val = int(x)
+            col = index % size + 1
+            row = index // size + 1
+            val = char_values[x]
             if val > 0:
                 sudoku.set_cell((row, col), val)
             index += 1
@@ -0,0 +1,139 @@
+#!/usr/env/python
+# 퍼즐 생성기
+# 무작위 exact cover 탐색으로 완성된 grid 를 만들고, 해가 하나로 유지되는 동안 숫자를 지운 뒤
+# Sudoku.solve 가 어떤 technique 까지 써야 풀리는지로 난이도를 매긴다
+#
+#   python sudoku_generator.py --count 1000 --workers 0 --rating try > puzzles.txt
+#
+# 한 줄에 "퍼즐 난이도 주어진숫자수" 를 만들어지는 대로 쓴다
+import argparse
+import functools
+import multiprocessing
+import os
+import random
+import sys
+
+import sudoku
+
+# 쉬운 것부터. beyond 는 Try 로도 끝까지 못 푸는 퍼즐
+# subset 다음은 Sudoku.solve_patterns 의 stage 들을 solve 가 부르는 순서대로
+pattern_ratings = ["locked", "xwing", "xywing", "swordfish", "jellyfish"]
+ratings = ["singles", "subset2", "subset3", "subset4"] + pattern_ratings + ["try", "beyond"]
+
+def random_solution(rng):
+    return sudoku.search_solutions([0] * 81, 1, rng=rng)[0]
+
+# grid 는 solution 에서 removed 칸을 지운 퍼즐. solution 말고 다른 해가 있는지
+# 다른 해는 removed 중 어딘가가 solution 과 다르므로, 앞의 칸들은 solution 값으로 두고 한 칸씩 다르게 해 본다
+# peer 의 숫자만으로 값이 하나로 정해지는 칸 (naked single) 은 탐색하지 않는다
+def has_other_solution(grid, solution, removed):
+    grid = list(grid)
+    for index in removed:
+        seen = 0
+        for peer in sudoku.peer_indices[index]:
+            if grid[peer]:
+                seen |= sudoku.value_to_bit(grid[peer])
+        if sudoku.popcount(sudoku.all_values_mask & ~seen) == 1:
+            grid[index] = solution[index]
+            continue
+        if sudoku.search_solutions(grid, 1, exclude=[(index, solution[index])]):
+            return True
+        grid[index] = solution[index]
+    return False
+
+# 무작위 순서로 숫자를 지워 본다. symmetric 이면 가운데 대칭인 두 칸을 같이 지운다
+def dig(solution, rng, symmetric=False):
+    grid = list(solution)
+    order = list(range(81))
+    rng.shuffle(order)
+    for index in order:
+        removed = sorted(set([index, 80 - index])) if symmetric else [index]
+        if any(grid[cell] == 0 for cell in removed):
+            continue
+        for cell in removed:
+            grid[cell] = 0
+        if has_other_solution(grid, solution, removed):
+            for cell in removed:
+                grid[cell] = solution[cell]
+    return grid
+
+# 풀 때 실제로 무언가를 지우거나 놓은 technique 중 가장 어려운 것
+def rate(grid, engine="mask"):
+    stats = sudoku.SolveStats()
+    (_, status) = sudoku.solve_puzzle(sudoku.format_grid(grid), engine, stats=stats)
+    if status != "solved":
+        return "beyond"
+    used = lambda technique: stats.counts[(technique, "eliminated")] or stats.counts[(technique, "placed")]
+    if used("try"):
+        return "try"
+    for technique in reversed(pattern_ratings):
+        if used(technique):
+            return technique
+    for size in (4, 3, 2):
+        if used("naked%d" % size) or used("hidden%d" % size):
+            return "subset%d" % size
+    return "singles"
+
+# seed 로 정해지는 퍼즐 하나. targets 가 있으면 그 난이도가 나올 때까지 (attempts 번까지) 다시 만든다
+# (퍼즐, 난이도, 해) 를 돌려주고, 끝내 못 만들면 퍼즐이 None
+def generate(seed, targets=None, symmetric=False, engine="mask", attempts=1000):
+    rng = random.Random(seed)
+    for _ in range(attempts):
+        solution = random_solution(rng)
+        grid = dig(solution, rng, symmetric)
+        rating = rate(grid, engine)
+        if targets is None or rating in targets:
+            return (grid, rating, solution)
+    return (None, None, None)
+
+# count 개를 만들어지는 순서대로 내준다. 같은 seed 면 같은 퍼즐 집합이 나온다 (순서는 workers 에 따라 다르다)
+def generate_many(count, seed=0, workers=1, targets=None, symmetric=False, engine="mask", chunksize=4):
+    worker = functools.partial(generate, targets=targets, symmetric=symmetric, engine=engine)
+    seeds = (seed * 1000003 + index for index in range(count))
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers <= 1:
+        for task_seed in seeds:
+            yield worker(task_seed)
+        return
+    with multiprocessing.Pool(workers) as pool:
+        for result in pool.imap_unordered(worker, seeds, chunksize):
+            yield result
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate unique-solution Sudoku puzzles rated by the techniques Sudoku.solve needs")
+    parser.add_argument("--count", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=1, help="generator processes (0: one per core)")
+    parser.add_argument("--rating", help="comma separated ratings to keep (%s)" % ", ".join(ratings))
+    parser.add_argument("--symmetric", action="store_true", help="remove clues in centrally symmetric pairs")
+    parser.add_argument("--engine", choices=sorted(sudoku.engines.keys()), default="mask", help="engine used for rating")
+    parser.add_argument("--packed-out", metavar="FILE", help="write puzzles to FILE in the packed binary format instead of text")
+    args = parser.parse_args()
+
+    targets = None
+    if args.rating is not None:
+        targets = set(args.rating.split(","))
+        unknown = targets.difference(ratings)
+        if unknown:
+            parser.error("unknown rating %s" % ", ".join(sorted(unknown)))
+    workers = args.workers if args.workers > 0 else None
+    writer = sudoku.PackedWriter(args.packed_out) if args.packed_out is not None else None
+    counts = dict()
+    try:
+        for (grid, rating, _) in generate_many(args.count, args.seed, workers, targets, args.symmetric, args.engine):
+            if grid is None:
+                continue
+            counts[rating] = counts.get(rating, 0) + 1
+            if writer is not None:
+                writer.write(grid)
+            else:
+                sys.stdout.write("%s %s %d\n" % (sudoku.format_grid(grid), rating, 81 - grid.count(0)))
+                sys.stdout.flush()
+    finally:
+        if writer is not None:
+            writer.close()
+    print(" ".join("%s=%d" % (rating, counts[rating]) for rating in ratings if rating in counts), file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
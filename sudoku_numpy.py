@@ -0,0 +1,131 @@
+#!/usr/env/python
+# NumPy 로 여러 판을 한꺼번에 propagation 한다
+# N 개 판의 후보를 (N, 81) uint16 mask 배열로 들고, naked single (Cell.set_value 의 peer 제거) 과
+# hidden single (solve_unique_unit 의 숫자 세기) 을 모든 판에 동시에 적용한다
+# 여기서 끝나지 않은 판은 sudoku.solve_many (Sudoku.solve) 로 넘긴다
+import itertools
+import time
+
+import numpy as np
+
+import sudoku
+
+all_values_mask = sudoku.all_values_mask
+value_bits = np.array([1 << value for value in range(9)], dtype=np.uint16)
+popcount_table = np.array([sudoku.popcount(mask) for mask in range(all_values_mask + 1)], dtype=np.uint8)
+# mask 에 bit 가 하나뿐이면 그 숫자, 아니면 0
+single_value_table = np.array([sudoku.mask_values[mask][0] if sudoku.popcount(mask) == 1 else 0 for mask in range(all_values_mask + 1)], dtype=np.uint8)
+
+unit_index_array = np.array(sudoku.unit_indices, dtype=np.intp)  # (27, 9)
+peer_index_array = np.array(sudoku.peer_indices, dtype=np.intp)  # (81, 20)
+# cell -> (속한 unit 3 개, 그 unit 안에서의 위치 3 개)
+cell_unit_array = np.zeros((81, 3), dtype=np.intp)
+cell_position_array = np.zeros((81, 3), dtype=np.intp)
+for unit, indices in enumerate(sudoku.unit_indices):
+    for position, index in enumerate(indices):
+        slot = 0 if unit < 9 else (1 if unit < 18 else 2)
+        cell_unit_array[index, slot] = unit
+        cell_position_array[index, slot] = position
+
+# (N, 81) 숫자 배열 (0 은 빈 칸) -> (N, 81) 후보 mask
+def grids_to_masks(grids):
+    grids = np.asarray(grids, dtype=np.intp)
+    masks = np.full(grids.shape, all_values_mask, dtype=np.uint16)
+    given = grids > 0
+    masks[given] = value_bits[grids[given] - 1]
+    return masks
+
+def masks_to_grids(masks):
+    return single_value_table[masks]
+
+# naked / hidden single 을 더 바뀌지 않을 때까지 모든 판에 적용한다
+# (masks, dead) 를 돌려준다. dead 는 모순이 생긴 판
+def propagate(masks, max_rounds=81):
+    masks = np.array(masks, dtype=np.uint16)
+    dead = np.zeros(masks.shape[0], dtype=bool)
+    for _ in range(max_rounds):
+        # naked single: 확정된 cell 의 숫자를 peer 에서 지운다
+        fixed = np.where(popcount_table[masks] == 1, masks, 0).astype(np.uint16)
+        peer_fixed = np.bitwise_or.reduce(fixed[:, peer_index_array], axis=2)
+        new_masks = masks & ~peer_fixed
+
+        # hidden single: unit 안에서 한 칸에만 들어갈 수 있는 숫자는 그 칸에 확정한다
+        unit_masks = new_masks[:, unit_index_array]  # (N, 27, 9)
+        has = (unit_masks[..., None] & value_bits) != 0  # (N, 27, 9 칸, 9 숫자)
+        counts = has.sum(axis=2)  # (N, 27, 9 숫자)
+        only = has & (counts == 1)[:, :, None, :]
+        hidden = (only * value_bits).sum(axis=3).astype(np.uint16)  # (N, 27, 9 칸)
+        cell_hidden = np.bitwise_or.reduce(hidden[:, cell_unit_array, cell_position_array], axis=2)  # (N, 81)
+        new_masks = np.where(cell_hidden != 0, new_masks & cell_hidden, new_masks)
+
+        # 후보가 없는 칸, 한 칸에 두 숫자가 확정된 경우, 어디에도 못 들어가는 숫자가 있으면 모순
+        dead |= (new_masks == 0).any(axis=1)
+        dead |= (popcount_table[cell_hidden] > 1).any(axis=1)
+        dead |= (counts == 0).any(axis=(1, 2))
+        new_masks[dead] = masks[dead]
+
+        if np.array_equal(new_masks, masks):
+            break
+        masks = new_masks
+    return (masks, dead)
+
+# 퍼즐 문자열 list 를 한꺼번에 풀어 입력 순서대로 (해 문자열, 상태, 초) list 를 돌려준다
+# 상태는 sudoku.solve_puzzle 과 같다. propagation 으로 끝난 판의 시간은 chunk 시간을 나눠 가진다
+# 끝나지 않은 판은 sudoku.solve_many 로 (workers 개 process 에서, limits 를 걸고) 마저 푼다
+# collect_stats 면 sudoku.solve_timed 처럼 SolveStats.as_dict() 를 네 번째 값으로 붙인다
+def solve_chunk(puzzles, engine="set", workers=1, chunksize=64, collect_stats=False, limits=None):
+    start = time.perf_counter()
+    extra = (dict(),) if collect_stats else ()
+    results = [None] * len(puzzles)
+    grids = []
+    rows = []
+    pending_rows = []
+    pending = []
+    for row, text in enumerate(puzzles):
+        if text.startswith(sudoku.snapshot_prefix):
+            # 멈췄던 풀이의 snapshot 은 그대로 sudoku.solve_many 로 넘긴다
+            pending_rows.append(row)
+            pending.append(text)
+            continue
+        try:
+            grid = sudoku.parse_puzzle(text)
+        except Exception:
+            results[row] = ("-", "invalid", 0.0) + extra
+            continue
+        if not sudoku.is_valid_grid(grid):
+            results[row] = (sudoku.format_grid(grid), "no_solution", 0.0) + extra
+            continue
+        grids.append(grid)
+        rows.append(row)
+    if len(grids) > 0:
+        propagate_grids(grids, rows, results, pending_rows, pending, start, extra)
+    for (row, result) in zip(pending_rows, sudoku.solve_many(pending, workers, chunksize, engine, collect_stats=collect_stats, limits=limits)):
+        results[row] = result
+    return results
+
+# solve_chunk 의 NumPy 단계. 끝난 판은 results 에 넣고, 끝나지 않은 판은 pending_rows / pending 에 붙인다
+def propagate_grids(grids, rows, results, pending_rows, pending, start, extra):
+    (masks, dead) = propagate(grids_to_masks(grids))
+    values = masks_to_grids(masks)
+    solved = (values != 0).all(axis=1) & ~dead
+    share = (time.perf_counter() - start) / len(grids)
+    for (position, row) in enumerate(rows):
+        if dead[position]:
+            results[row] = (sudoku.format_grid(grids[position]), "no_solution", share) + extra
+        elif solved[position]:
+            results[row] = (sudoku.format_grid(values[position].tolist()), "solved", share) + extra
+        else:
+            # 확정된 칸만 주어진 숫자로 해서 원래 풀이로 넘긴다
+            # 이 단계에서 지운 후보는 모두 확정된 칸의 peer 제거라서 set_grid 가 다시 만든다
+            pending_rows.append(row)
+            pending.append(sudoku.format_grid(values[position].tolist()))
+
+# 입력을 chunk_size 개씩 묶어 solve_chunk 로 푼다. 메모리는 chunk 크기만큼만 쓴다
+def solve_stream(puzzles, chunk_size=4096, engine="set", workers=1, chunksize=64, collect_stats=False, limits=None):
+    puzzles = iter(puzzles)
+    while True:
+        chunk = list(itertools.islice(puzzles, chunk_size))
+        if len(chunk) == 0:
+            break
+        for result in solve_chunk(chunk, engine, workers, chunksize, collect_stats, limits):
+            yield result
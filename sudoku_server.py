@@ -0,0 +1,361 @@
+#!/usr/env/python
+# asyncio 로 도는 풀이 서버
+# process pool 을 미리 띄워 두고, 짧은 시간 (batch_window) 안에 들어온 요청을 묶어서 worker 에 한 번에 넘긴다
+# queue 가 차면 바로 503 으로 거절하고 (backpressure), 요청마다 timeout 이 지나면 "timeout" 으로 답한다
+#
+#   python sudoku_server.py --port 8765 --workers 4
+#   python sudoku_server.py --client puzzles.txt --port 8765 --concurrency 32
+#
+#   POST /solve    {"puzzle": "0030...", "timeout": 2.0}  ->  {"solution": ..., "status": ..., "ms": ...}
+#   GET  /metrics  처리량, queue 깊이, batch 크기 등
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import asyncio
+import json
+import math
+import os
+import sys
+import time
+
+import sudoku
+
+# worker process 에서 돈다. deadline (time.time() 기준) 이 이미 지난 퍼즐은 풀지 않고,
+# 푸는 중에 deadline 이 오면 그때까지 채운 grid 를 "budget" 으로 돌려준다
+def solve_batch(texts, deadlines, engine="set", fast=False):
+    results = []
+    for (text, deadline) in zip(texts, deadlines):
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            results.append(("-", "timeout", 0.0))
+            continue
+        results.append(sudoku.solve_timed(text, engine, fast, time_limit=None if fast else remaining))
+    return results
+
+def warm_up():
+    return os.getpid()
+
+class Request:
+    def __init__(self, puzzle, timeout):
+        self.puzzle = puzzle
+        self.deadline = time.time() + timeout
+        self.future = asyncio.get_running_loop().create_future()
+
+class Metrics:
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.accepted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.timeouts = 0
+        self.batches = 0
+        self.batched = 0
+        self.max_queue = 0
+
+    def as_dict(self, queue_depth, in_flight):
+        uptime = time.perf_counter() - self.start
+        return {
+            "uptime": uptime,
+            "accepted": self.accepted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "timeouts": self.timeouts,
+            "puzzles_per_sec": self.completed / uptime if uptime > 0 else 0.0,
+            "batches": self.batches,
+            "mean_batch": self.batched / self.batches if self.batches else 0.0,
+            "queue_depth": queue_depth,
+            "max_queue_depth": self.max_queue,
+            "in_flight_batches": in_flight,
+        }
+
+class SolveServer:
+    def __init__(self, workers=None, engine="set", fast=False, batch_size=16, batch_window=0.005, max_queue=1024, timeout=10.0):
+        self.workers = workers or os.cpu_count() or 1
+        self.engine = engine
+        self.fast = fast
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.timeout = timeout
+        self.queue = asyncio.Queue(max_queue)
+        self.metrics = Metrics()
+        self.executor = None
+        # worker 수 만큼만 batch 를 보내서, 어려운 퍼즐이 잡고 있는 worker 말고 나머지는 계속 queue 를 비운다
+        self.slots = asyncio.Semaphore(self.workers)
+        self.in_flight = 0
+        self.tasks = []
+
+    async def start(self):
+        self.executor = ProcessPoolExecutor(self.workers)
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*[loop.run_in_executor(self.executor, warm_up) for _ in range(self.workers)])
+        self.tasks.append(asyncio.create_task(self.dispatch()))
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # queue 가 차 있으면 None (호출한 쪽에서 503)
+    async def solve(self, puzzle, timeout=None):
+        timeout = self.timeout if timeout is None else min(timeout, self.timeout)
+        request = Request(puzzle, timeout)
+        try:
+            self.queue.put_nowait(request)
+        except asyncio.QueueFull:
+            self.metrics.rejected += 1
+            return None
+        self.metrics.accepted += 1
+        self.metrics.max_queue = max(self.metrics.max_queue, self.queue.qsize())
+        try:
+            return await asyncio.wait_for(asyncio.shield(request.future), timeout)
+        except asyncio.TimeoutError:
+            # 취소한 요청은 run_batch 가 건너뛴다. 같은 때에 결과가 먼저 왔으면 (run_batch 가 이미 셌다) 그 결과로 답한다
+            if not request.future.cancel():
+                return request.future.result()
+            self.metrics.timeouts += 1
+            return ("-", "timeout", timeout)
+
+    # 첫 요청이 오면 batch_window 동안 (또는 batch_size 가 찰 때까지) 더 모아서 worker 들에 나눠 보낸다
+    # 한 worker 는 받은 퍼즐을 차례로 풀므로, 어려운 퍼즐 하나 뒤에 batch 전체가 묶여 다른 worker 가 노는 일이 없게 한다
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            end = loop.time() + self.batch_window
+            while len(batch) < self.batch_size:
+                remaining = end - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self.queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+            size = math.ceil(len(batch) / self.workers)
+            for start in range(0, len(batch), size):
+                await self.slots.acquire()
+                # 기다리는 동안 timeout 이 지난 요청은 보내지 않는다
+                chunk = [request for request in batch[start:start+size] if not request.future.done() and time.time() < request.deadline]
+                if len(chunk) == 0:
+                    self.slots.release()
+                    continue
+                self.in_flight += 1
+                self.metrics.batches += 1
+                self.metrics.batched += len(chunk)
+                self.tasks.append(asyncio.create_task(self.run_batch(chunk)))
+            self.tasks = [task for task in self.tasks if not task.done()]
+
+    async def run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        try:
+            results = await loop.run_in_executor(self.executor, solve_batch, [request.puzzle for request in batch], [request.deadline for request in batch], self.engine, self.fast)
+            for (request, result) in zip(batch, results):
+                # timeout 으로 이미 답한 (취소된) 요청은 solve 가 timeouts 에 셌다
+                if request.future.done():
+                    continue
+                if result[1] == "timeout":
+                    self.metrics.timeouts += 1
+                else:
+                    self.metrics.completed += 1
+                request.future.set_result(result)
+        except Exception as e:
+            for request in batch:
+                if not request.future.done():
+                    request.future.set_exception(e)
+        finally:
+            self.in_flight -= 1
+            self.slots.release()
+
+    def metrics_dict(self):
+        return self.metrics.as_dict(self.queue.qsize(), self.in_flight)
+
+    # HTTP/1.1 (keep-alive) 요청을 연결이 닫힐 때까지 처리한다
+    # 요청 형식이 틀리면 400, 처리 중에 예상하지 못한 오류가 나면 500 으로 답하고 연결을 닫는다
+    async def handle(self, reader, writer):
+        try:
+            while True:
+                request = await read_http(reader)
+                if request is None:
+                    break
+                (method, path, body) = request
+                (code, reply) = await self.route(method, path, body)
+                write_http(writer, code, reply)
+                await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except BadRequest as e:
+            await reply_error(writer, 400, str(e))
+        except Exception as e:
+            print("error while handling a request: %r" % e, file=sys.stderr)
+            await reply_error(writer, 500, "internal error")
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/metrics":
+            return (200, self.metrics_dict())
+        if method != "POST" or path != "/solve":
+            return (404, {"error": "not found"})
+        try:
+            message = json.loads(body)
+            puzzle = message["puzzle"]
+            timeout = message.get("timeout")
+        except Exception:
+            return (400, {"error": "expected {\"puzzle\": \"...\"}"})
+        if not isinstance(puzzle, str):
+            return (400, {"error": "puzzle must be a string"})
+        if timeout is not None and (isinstance(timeout, bool) or not isinstance(timeout, (int, float)) or not timeout > 0):
+            return (400, {"error": "timeout must be a positive number of seconds"})
+        result = await self.solve(puzzle, timeout)
+        if result is None:
+            return (503, {"status": "busy"})
+        (solution, status, elapsed) = result
+        return (200, {"solution": solution, "status": status, "ms": elapsed * 1000})
+
+http_reasons = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error", 503: "Service Unavailable"}
+
+# read_http 가 읽을 수 없는 요청
+class BadRequest(Exception):
+    pass
+
+# (method, path, body) 또는 연결이 닫혔으면 None. 요청 줄이나 Content-Length 가 틀리면 BadRequest
+async def read_http(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    parts = line.decode("latin-1").split()
+    if len(parts) < 2:
+        raise BadRequest("malformed request line")
+    (method, path) = parts[:2]
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        (name, _, value) = header.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            try:
+                length = int(value.strip())
+            except ValueError:
+                raise BadRequest("malformed Content-Length")
+            if length < 0:
+                raise BadRequest("malformed Content-Length")
+    body = await reader.readexactly(length) if length else b""
+    return (method, path, body)
+
+def write_http(writer, code, reply):
+    body = json.dumps(reply).encode()
+    writer.write(("HTTP/1.1 %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % (code, http_reasons[code], len(body))).encode() + body)
+
+# 연결을 닫기 전에 마지막으로 오류를 알린다 (이미 끊긴 연결이면 그냥 넘어간다)
+async def reply_error(writer, code, message):
+    try:
+        write_http(writer, code, {"error": message})
+        await writer.drain()
+    except ConnectionError:
+        pass
+
+async def serve(args):
+    server = SolveServer(args.workers or None, args.engine, args.fast, args.batch_size, args.batch_window / 1000, args.max_queue, args.timeout)
+    await server.start()
+    if args.unix is not None:
+        listener = await asyncio.start_unix_server(server.handle, args.unix)
+    else:
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+    print("serving on %s with %d workers" % (args.unix or "%s:%d" % (args.host, args.port), server.workers), file=sys.stderr)
+    try:
+        async with listener:
+            await listener.serve_forever()
+    finally:
+        await server.close()
+
+# 시험용 client. concurrency 개의 연결로 퍼즐을 보내고 처리량과 latency 를 찍는다
+async def run_client(args):
+    with open(args.client) as f:
+        puzzles = list(sudoku.read_puzzles(f))
+    pending = list(enumerate(puzzles))
+    pending.reverse()
+    latencies = []
+    statuses = dict()
+
+    async def lane():
+        if args.unix is not None:
+            (reader, writer) = await asyncio.open_unix_connection(args.unix)
+        else:
+            (reader, writer) = await asyncio.open_connection(args.host, args.port)
+        try:
+            while pending:
+                (_, puzzle) = pending.pop()
+                body = json.dumps({"puzzle": puzzle, "timeout": args.timeout}).encode()
+                start = time.perf_counter()
+                writer.write(("POST /solve HTTP/1.1\r\nHost: local\r\nContent-Type: application/json\r\nContent-Length: %d\r\n\r\n" % len(body)).encode() + body)
+                await writer.drain()
+                (code, reply) = await read_reply(reader)
+                latencies.append(time.perf_counter() - start)
+                status = reply.get("status", str(code))
+                statuses[status] = statuses.get(status, 0) + 1
+        finally:
+            writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[lane() for _ in range(args.concurrency)])
+    wall = time.perf_counter() - start
+    latencies.sort()
+    print("%d puzzles in %.3fs (%.1f/s) p50=%.1fms p99=%.1fms %s" % (
+        len(latencies), wall, len(latencies) / wall if wall > 0 else 0.0,
+        latencies[len(latencies) // 2] * 1000 if latencies else 0.0,
+        latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000 if latencies else 0.0,
+        " ".join("%s=%d" % item for item in sorted(statuses.items()))))
+    print(json.dumps(await fetch_metrics(args)), file=sys.stderr)
+
+async def read_reply(reader):
+    line = await reader.readline()
+    code = int(line.split()[1])
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b"\r\n", b"\n", b""):
+            break
+        (name, _, value) = header.decode("latin-1").partition(":")
+        if name.strip().lower() == "content-length":
+            length = int(value.strip())
+    return (code, json.loads(await reader.readexactly(length)))
+
+async def fetch_metrics(args):
+    if args.unix is not None:
+        (reader, writer) = await asyncio.open_unix_connection(args.unix)
+    else:
+        (reader, writer) = await asyncio.open_connection(args.host, args.port)
+    writer.write(b"GET /metrics HTTP/1.1\r\nHost: local\r\n\r\n")
+    await writer.drain()
+    (_, reply) = await read_reply(reader)
+    writer.close()
+    return reply
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Sudoku solving service")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--unix", metavar="PATH", help="listen on (or connect to) a unix socket instead of TCP")
+    parser.add_argument("--workers", type=int, default=0, help="solver processes (0: one per core)")
+    parser.add_argument("--engine", choices=sorted(sudoku.engines.keys()), default="mask")
+    parser.add_argument("--fast", action="store_true", help="use the backtracking solver")
+    parser.add_argument("--batch-size", type=int, default=16, help="most puzzles sent to a worker at once")
+    parser.add_argument("--batch-window", type=float, default=5.0, help="ms to wait for more requests before sending a batch")
+    parser.add_argument("--max-queue", type=int, default=1024, help="queued requests before answering 503")
+    parser.add_argument("--timeout", type=float, default=10.0, help="longest time a request may wait, in seconds")
+    parser.add_argument("--client", metavar="FILE", help="act as a test client sending the puzzles in FILE")
+    parser.add_argument("--concurrency", type=int, default=16, help="client connections")
+    return parser.parse_args(argv)
+
+def main():
+    args = parse_args()
+    if args.client is not None:
+        asyncio.run(run_client(args))
+    else:
+        try:
+            asyncio.run(serve(args))
+        except KeyboardInterrupt:
+            pass
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,322 @@
+#!/usr/env/python
+# python -m unittest test_sudoku
+import asyncio
+import concurrent.futures
+import io
+import os
+import tempfile
+import threading
+import unittest
+
+import sudoku
+import sudoku_server
+
+# AI Escargot: Try 를 여러 번 해야 하고, probe_depth 1 로는 끝까지 풀리지 않는 퍼즐
+escargot = "100007090030020008009600500005300900010080002600004000300000010040000007007000300"
+
+# 한도 없이 한 번에 푼 grid
+def solved_grid(text, engine="mask", depth=1):
+    board = sudoku.Sudoku(engine=engine, gui=False)
+    board.set_print(False)
+    board.set_probe_depth(depth)
+    board.set_grid(sudoku.parse_puzzle(text))
+    board.solve()
+    return board.get_grid()
+
+class BudgetTest(unittest.TestCase):
+    # max_probes=1 로 잘라 풀어도 매번 probe 하나는 끝나서 결국 다 푼다
+    def test_single_probe_slices_finish(self):
+        board = sudoku.Sudoku(engine="mask", gui=False)
+        board.set_print(False)
+        board.set_grid(sudoku.parse_puzzle(escargot))
+        for _ in range(1000):
+            budget = sudoku.SolveBudget(max_probes=1)
+            if board.solve(budget=budget):
+                break
+            self.assertEqual(budget.probes, 1)
+        else:
+            self.fail("max_probes=1 slices did not finish")
+        self.assertEqual(board.get_grid(), solved_grid(escargot))
+
+    # probe 안에서 지웠다가 되돌린 후보는 max_eliminations 에 세지 않는다
+    def test_elimination_slices_finish(self):
+        board = sudoku.Sudoku(engine="mask", gui=False)
+        board.set_print(False)
+        board.set_grid(sudoku.parse_puzzle(escargot))
+        for _ in range(1000):
+            if board.solve(budget=sudoku.SolveBudget(max_eliminations=1)):
+                break
+        else:
+            self.fail("max_eliminations=1 slices did not finish")
+        self.assertEqual(board.get_grid(), solved_grid(escargot))
+
+    # 한도에 걸려 멈춘 뒤 예외로 끝난 solve 는 Scheduler / Try 위치 / probe_seen 을 남기지 않는다
+    def test_failed_solve_drops_resume_state(self):
+        def broken(*args):
+            raise Exception("broken technique")
+        for recursion in (False, True):
+            board = sudoku.Sudoku(engine="mask", gui=False)
+            board.set_print(False)
+            board.set_grid(sudoku.parse_puzzle(escargot))
+            self.assertFalse(board.solve(budget=sudoku.SolveBudget(max_probes=5)))
+            self.assertIsNotNone(board.scheduler)
+            self.assertGreater(board.try_position, 0)
+            board.changed.add(next(iter(board.unknown_cells)))
+            board.solve_unique = broken
+            with self.assertRaises(Exception):
+                board.solve(recursion=recursion)
+            self.assertIsNone(board.scheduler)
+            self.assertEqual(board.try_position, 0)
+            self.assertIsNone(board.probe_seen)
+            del board.solve_unique
+            board.solve()
+            self.assertEqual(board.get_grid(), solved_grid(escargot))
+
+# sudoku_generator 로 만든, 각 pattern stage 가 가장 어려운 technique 인 퍼즐 (stage 없이는 Try 가 필요하다)
+pattern_puzzles = {
+    "locked": "000000000007006500065400080000020040070000200058007060900000000000008910000035800",
+    "xwing": "500390407300200000600050000010000000020040003004002108006700200070003064009000000",
+    "xywing": "009030210040900000812060000006000000003650700700000064000321009000000008000000400",
+    "swordfish": "000008700704005609900003000000070410000000000060004075400060000091030800800000030",
+    "jellyfish": "400090000950006008010005020000908006800070405000000000600000030580000047000054002",
+}
+
+class PatternTest(unittest.TestCase):
+    # pattern 을 켜고 끈 풀이가 두 engine 모두 backtracking 의 해와 같고, 켜면 그 stage 가 후보를 지워서 Try 없이 풀린다
+    def test_patterns_agree_with_search(self):
+        for (technique, text) in pattern_puzzles.items():
+            (solution,) = sudoku.search_solutions(sudoku.parse_puzzle(text), 2)
+            for engine in sudoku.engines:
+                for patterns in (True, False):
+                    board = sudoku.Sudoku(engine=engine, gui=False)
+                    board.set_print(False)
+                    board.set_patterns(patterns)
+                    stats = board.enable_stats()
+                    board.set_grid(sudoku.parse_puzzle(text))
+                    board.solve()
+                    self.assertEqual(board.get_grid(), solution, (technique, engine, patterns))
+                    if patterns:
+                        self.assertGreater(stats.counts[(technique, "eliminated")], 0, (technique, engine))
+                        self.assertEqual(stats.counts[("try", "eliminated")] + stats.counts[("try", "placed")], 0, (technique, engine))
+
+# 결과를 기억하지 않는 probe_memo
+class NoMemo(dict):
+    def __setitem__(self, key, value):
+        pass
+
+class ProbeMemoTest(unittest.TestCase):
+    # 이전 Try 바퀴의 probe 결과에서 이어 푼 것 (memo_resumes) 과 처음부터 다시 푼 것이 같다
+    def test_resume_matches_fresh_probes(self):
+        for engine in sudoku.engines:
+            grids = []
+            for memo in (True, False):
+                board = sudoku.Sudoku(engine=engine, gui=False)
+                board.set_print(False)
+                board.set_probe_depth(2)
+                stats = board.enable_stats()
+                if not memo:
+                    board.probe_memo = NoMemo()
+                board.set_grid(sudoku.parse_puzzle(escargot))
+                board.solve()
+                grids.append(board.get_grid())
+                if memo:
+                    self.assertGreater(stats.counts[("probe", "memo_resumes")], 0)
+            self.assertEqual(grids[0], grids[1])
+
+class ParallelProbeTest(unittest.TestCase):
+    # core 수와 상관없이 pool 을 직접 만들어서, 나눠 돌린 Try 가 한 process 와 같은 답을 내는지 본다
+    def test_pool_matches_serial(self):
+        with concurrent.futures.ProcessPoolExecutor(2) as pool:
+            board = sudoku.Sudoku(engine="mask", gui=False)
+            board.set_print(False)
+            board.set_probe_depth(2)
+            board.set_probe_pool(pool, 2)
+            board.set_grid(sudoku.parse_puzzle(escargot))
+            board.solve()
+        self.assertEqual(board.get_grid(), solved_grid(escargot, depth=2))
+
+    def test_no_pool_for_one_worker(self):
+        self.assertEqual(sudoku.make_probe_pool(1), (None, 1))
+
+class SnapshotTest(unittest.TestCase):
+    def test_round_trip(self):
+        board = sudoku.Sudoku(engine="set", gui=False)
+        board.set_print(False)
+        board.set_grid(sudoku.parse_puzzle(escargot))
+        board.solve(budget=sudoku.SolveBudget(max_probes=5))
+        data = board.snapshot()
+        for engine in sudoku.engines:
+            self.assertEqual(sudoku.board_from_snapshot(data, engine).snapshot(), data)
+            self.assertEqual(sudoku.board_from_snapshot(sudoku.snapshot_text(data), engine).snapshot(), data)
+
+    # snapshot 에서 되살린 판을 한도 하나로 풀 때마다 snapshot 이 달라지고 (진행), 끝까지 풀면 한 번에 푼 것과 같다
+    def test_resumed_slices_make_progress(self):
+        for depth in (1, 2):
+            board = sudoku.Sudoku(engine="mask", gui=False)
+            board.set_print(False)
+            board.set_grid(sudoku.parse_puzzle(escargot))
+            previous = None
+            for index in range(2000):
+                board.set_probe_depth(depth)
+                if board.solve(budget=sudoku.SolveBudget(max_probes=1)):
+                    break
+                data = board.snapshot()
+                self.assertNotEqual(data, previous)
+                previous = data
+                board = sudoku.board_from_snapshot(data, ("mask", "set")[index % 2])
+                board.set_print(False)
+            else:
+                self.fail("resumed slices did not finish")
+            self.assertEqual(board.get_grid(), solved_grid(escargot, depth=depth))
+
+    # solve_puzzle 에 snapshot 문자열을 다시 넘기면 이어서 푼다
+    def test_solve_puzzle_resume(self):
+        text = escargot
+        for _ in range(1000):
+            (text, status) = sudoku.solve_puzzle(text, "mask", budget=sudoku.SolveBudget(max_probes=3), snapshot=True)
+            if status != "budget":
+                break
+        self.assertEqual(status, "partial")
+        self.assertEqual(sudoku.parse_puzzle(text), solved_grid(escargot))
+
+class CacheTest(unittest.TestCase):
+    def setUp(self):
+        self.text = pattern_puzzles["xwing"]
+        self.grid = sudoku.parse_puzzle(self.text)
+        # 숫자를 바꾸고, band 안 / band 끼리 줄을 섞고, 뒤집은 같은 퍼즐
+        self.transform = ([0, 3, 1, 2, 9, 8, 7, 5, 4, 6], [5, 3, 4, 8, 6, 7, 1, 0, 2], [2, 0, 1, 6, 7, 8, 4, 3, 5], True)
+        self.variant = sudoku.transform_grid(self.grid, *self.transform)
+
+    def test_canonical_form(self):
+        (canonical, transform) = sudoku.canonical_form(self.grid)
+        (variant_canonical, variant_transform) = sudoku.canonical_form(self.variant)
+        self.assertEqual(canonical, variant_canonical)
+        self.assertEqual(sudoku.inverse_transform_grid(canonical, *transform), self.grid)
+        self.assertEqual(sudoku.inverse_transform_grid(canonical, *variant_transform), self.variant)
+
+    # 변형은 cache 에서 답하지만 cache 에 든 해가 아니라 그 변형의 해를 돌려준다. save / load 뒤에도 같다
+    def test_variant_hits_return_own_solution(self):
+        variant_text = sudoku.format_grid(self.variant)
+        (variant_solution,) = sudoku.search_solutions(self.variant, 2)
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "cache.jsonl")
+            cache = sudoku.SolutionCache(path=path)
+            results = list(sudoku.solve_many_cached([self.text, variant_text], cache, workers=1, engine="mask"))
+            self.assertEqual((cache.hits, cache.misses), (1, 1))
+            self.assertEqual(results[1][:2], (sudoku.format_grid(variant_solution), "solved"))
+            self.assertNotEqual(results[0][0], results[1][0])
+            cache.save()
+            loaded = sudoku.SolutionCache(path=path)
+            results = list(sudoku.solve_many_cached([variant_text], loaded, workers=1, engine="mask"))
+            self.assertEqual((loaded.hits, loaded.misses), (1, 0))
+            self.assertEqual(results[0][:2], (sudoku.format_grid(variant_solution), "solved"))
+
+class SolveManyTest(unittest.TestCase):
+    # 결과는 입력 순서대로이고, 꺼내지 않은 결과가 window (workers * chunksize * 4) 를 넘도록 입력을 미리 읽지 않는다
+    def test_ordered_and_bounded(self):
+        puzzles = [escargot, "0" * 81, sudoku.format_grid(solved_grid(escargot))] * 20
+        expected = [sudoku.solve_timed(text, "mask", True)[:2] for text in puzzles]
+        read = []
+        def feed():
+            for text in puzzles:
+                read.append(text)
+                yield text
+        results = sudoku.solve_many(feed(), workers=2, chunksize=2, engine="mask", fast=True)
+        for (index, result) in enumerate(results):
+            self.assertEqual(result[:2], expected[index])
+            self.assertLessEqual(len(read), index + 1 + 2 * 2 * 4)
+            if index == 29:
+                break
+        results.close()
+        self.assertLess(len(read), len(puzzles))
+
+class PackedTest(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.text_path = os.path.join(self.dir.name, "puzzles.txt")
+        self.puzzles = [escargot, "0" * 81, sudoku.format_grid(solved_grid(escargot))]
+        with open(self.text_path, "w") as f:
+            f.write("# comment\n\n" + "\n".join(self.puzzles) + "\n")
+
+    def tearDown(self):
+        self.dir.cleanup()
+
+    def test_round_trip(self):
+        packed_path = os.path.join(self.dir.name, "puzzles.sdkb")
+        self.assertEqual(sudoku.pack_puzzles(self.text_path, packed_path), 3)
+        self.assertTrue(sudoku.is_packed_file(packed_path))
+        self.assertFalse(sudoku.is_packed_file(self.text_path))
+        packed = sudoku.PackedFile(packed_path)
+        try:
+            self.assertEqual(list(packed.puzzles()), self.puzzles)
+            self.assertEqual(packed.grid(0), sudoku.parse_puzzle(escargot))
+        finally:
+            packed.close()
+        solution_path = os.path.join(self.dir.name, "solutions.sdkb")
+        with sudoku.PackedWriter(solution_path, "solution") as writer:
+            writer.write(self.puzzles[2], "solved")
+            writer.write("-", "budget")
+        packed = sudoku.PackedFile(solution_path)
+        try:
+            self.assertEqual(packed.kind, "solution")
+            self.assertEqual([packed.status(0), packed.status(1)], ["solved", "budget"])
+            self.assertEqual(packed.grid(1), [0] * 81)
+        finally:
+            packed.close()
+
+    # pipe 로 들어온 text 입력은 magic 을 확인하느라 앞 byte 를 잃지 않는다
+    @unittest.skipUnless(hasattr(os, "mkfifo"), "needs mkfifo")
+    def test_fifo_input(self):
+        fifo_path = os.path.join(self.dir.name, "fifo")
+        os.mkfifo(fifo_path)
+        def feed():
+            with open(fifo_path, "w") as f, open(self.text_path) as source:
+                f.write(source.read())
+        thread = threading.Thread(target=feed)
+        thread.start()
+        out = io.StringIO()
+        counts = sudoku.run_batch(fifo_path, fast=True, out=out)
+        thread.join()
+        self.assertEqual(sum(counts.values()), 3)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
+
+class ServerTest(unittest.TestCase):
+    # worker 없이 route 만 부른다: 형식이 틀린 요청은 solve 까지 가지 않고 400
+    def test_bad_solve_requests(self):
+        server = sudoku_server.SolveServer(workers=1)
+        bodies = [b"not json", b'{"puzzle": 5}', b'{"puzzle": "", "timeout": "x"}',
+                  b'{"puzzle": "", "timeout": -1}', b'{"puzzle": "", "timeout": true}']
+        for body in bodies:
+            (code, _) = asyncio.run(server.route("POST", "/solve", body))
+            self.assertEqual(code, 400, body)
+
+    # timeout 이 지난 요청은 timeouts 에만, 답한 요청은 completed 에만 센다
+    def test_metrics_count_each_request_once(self):
+        async def run():
+            server = sudoku_server.SolveServer(workers=2, engine="mask", timeout=5.0)
+            await server.start()
+            try:
+                timeouts = [0.001 if index % 3 == 0 else 5.0 for index in range(36)]
+                results = await asyncio.gather(*[server.solve(escargot, timeout) for timeout in timeouts])
+                await asyncio.sleep(0.5)
+                return (results, server.metrics_dict())
+            finally:
+                await server.close()
+        (results, metrics) = asyncio.run(run())
+        self.assertEqual(metrics["accepted"], 36)
+        self.assertEqual(metrics["completed"] + metrics["timeouts"], 36)
+        self.assertEqual(metrics["timeouts"], sum(1 for result in results if result[1] == "timeout"))
+
+    def test_malformed_http(self):
+        async def read(data):
+            reader = asyncio.StreamReader()
+            reader.feed_data(data)
+            reader.feed_eof()
+            return await sudoku_server.read_http(reader)
+        for data in [b"GARBAGE\r\n\r\n", b"POST /solve HTTP/1.1\r\nContent-Length: x\r\n\r\n"]:
+            with self.assertRaises(sudoku_server.BadRequest):
+                asyncio.run(read(data))
+        self.assertEqual(asyncio.run(read(b"POST /solve HTTP/1.1\r\nContent-Length: 2\r\n\r\n{}")), ("POST", "/solve", b"{}"))
+
+if __name__ == '__main__':
+    unittest.main()